@@ -1,14 +1,22 @@
 ####################################################
 # Data-Types
 ####################################################
+import struct
+
+# All fixed-width fields are read with precompiled struct objects at
+# absolute offsets, so no intermediate slices are created. Any object
+# supporting the buffer protocol (bytes, bytearray, memoryview) works.
+_U16 = struct.Struct('!H').unpack_from
+_U32 = struct.Struct('!I').unpack_from
+
 def u16(data, offset: int = 0):
-  return (data[offset] << 8) | data[offset+1]
+  return _U16(data, offset)[0]
 
 def u8(data, offset: int = 0):
   return int(data[offset])
 
 def u32(data, offset: int = 0):
-  return (data[offset] << 24) | (data[offset+1] << 16) | (data[offset+2] << 8) | data[offset+3]
+  return _U32(data, offset)[0]
 
 ####################################################
 # DNS-Definitions
@@ -18,21 +26,21 @@ from . import _stdrr as std_rr
 
 DNS_TypeValues = {
   1: ('A', 'host Address', std_rr.kDNSType_A),
-  2: ('NS', 'authoritative Name Server', std_rr.kDNSType_DN),
+  2: ('NS', 'authoritative Name Server', std_rr.kDNSType_NS),
   3: ('MD', 'Mail Destination', std_rr.kDNSType_DN),
   4: ('MF', 'Mail Forwarder', std_rr.kDNSType_DN),
-  5: ('CNAME', 'Canonical Name', std_rr.kDNSType_DN),
+  5: ('CNAME', 'Canonical Name', std_rr.kDNSType_CNAME),
   6: ('SOA', 'Start of Authority', std_rr.kDNSType_SOA),
   7: ('MB', 'Mailbox', std_rr.kDNSType_DN),
   8: ('MG', 'Mail Group', std_rr.kDNSType_DN),
   9: ('MR', 'Mail Rename', std_rr.kDNSType_DN),
   10: ('NULL', 'Null RR', std_rr.kDNSType_MemCpy),
   11: ('WKS', 'Well-Known-Service', std_rr.kDNSType_MemCpy),
-  12: ('PTR', 'Domain name PoinTeR', std_rr.kDNSType_DN),
+  12: ('PTR', 'Domain name PoinTeR', std_rr.kDNSType_PTR),
   13: ('HINFO', 'Host INFOrmation', std_rr.kDNSType_HINFO),
   14: ('MINFO', 'Mailbox INFOrmation', std_rr.kDNSType_MINFO),
   15: ('MX', 'Mail eXchanger', std_rr.kDNSType_MX),
-  16: ('TXT', 'Arbitrary text string', std_rr.kDNSType_MemCpy),
+  16: ('TXT', 'Arbitrary text string', std_rr.kDNSType_TXT),
   17: ('RP', 'Responsible person', std_rr.kDNSType_RP),
   18: ('AFSDB', 'AFS cell database', std_rr.kDNSType_AFSDB),
   19: ('X25', 'X_25 calling address', std_rr.kDNSType_MemCpy),
@@ -55,7 +63,7 @@ DNS_TypeValues = {
   36: ('KX', 'Key Exchange', std_rr.kDNSType_KX),
   37: ('CERT', 'Certification record', std_rr.kDNSType_MemCpy),
   38: ('A6', 'IPv6 Address (deprecated)', std_rr.kDNSType_MemCpy),
-  39: ('DNAME', 'Non-terminal DNAME (for IPv6)', std_rr.kDNSType_DN),
+  39: ('DNAME', 'Non-terminal DNAME (for IPv6)', std_rr.kDNSType_DNAME),
   40: ('SINK', 'Kitchen sink (experimental)', std_rr.kDNSType_MemCpy),
   41: ('OPT', 'EDNS0 option (meta-RR)', std_rr.kDNSType_OPT),
   42: ('APL', 'Address Prefix List', std_rr.kDNSType_MemCpy),
@@ -102,6 +110,11 @@ DNS_ClassValues = {
 ####################################################
 # Module-Definitions
 ####################################################
+from ._intern import (
+  InternPool,
+  NAME_POOL
+)
+
 from ._rr import (
   get_query,
   get_resource,
@@ -118,12 +131,81 @@ from ._mDNSCommon import (
   buildq,
   to_bytes,
   DNSMessage,
-  DNSMessageHeader
+  DNSMessageHeader,
+  LazySection,
+  Peek,
+  PeekFilter,
+  peek
+)
+
+from ._batch import (
+  loadm_many,
+  DNSMessageBatch
+)
+
+from ._ring import (
+  RecvRing
+)
+
+from ._store import (
+  RecordStore
+)
+
+from ._stats import (
+  SourceStats
+)
+
+from ._sketch import (
+  CountMinSketch
+)
+
+from ._cache import (
+  RecordCache,
+  CacheEntry,
+  name_key,
+  rdata_key
+)
+
+from ._dispatch import (
+  Dispatcher,
+  POLICY_BLOCK,
+  POLICY_DROP_NEWEST,
+  POLICY_DROP_OLDEST
 )
 
 from ._mDNS import (
   handler,
+  remove_handler,
+  prefilter,
   startup,
   sendN,
-  MDNS_SOCKET
-)
\ No newline at end of file
+  dnssocket,
+  get_socket,
+  close_socket
+)
+
+# Resolved on first access: MDNS_SOCKET creates the default socket, the
+# other names pull in modules (asyncio, mmap, ...) the parser does not need.
+_LAZY = {
+  'listen': '_aio',
+  'AsyncListener': '_aio',
+  'MulticastDNSProtocol': '_aio',
+  'browse': '_browse',
+  'ServiceBrowser': '_browse',
+  'ServiceInfo': '_browse',
+  'PcapReader': '_pcap',
+  'read_pcap': '_pcap',
+  'PcapWriter': '_pcap',
+  'PacketLog': '_log',
+  'SpillBuffer': '_log',
+  'udp_payload': '_pcap',
+  'MDNS_PORT': '_pcap'
+}
+
+def __getattr__(name):
+  if name == 'MDNS_SOCKET':
+    return get_socket()
+  if name in _LAZY:
+    import importlib
+    return getattr(importlib.import_module('.' + _LAZY[name], __name__), name)
+  raise AttributeError("module 'mdns' has no attribute '%s'" % (name))
@@ -0,0 +1,117 @@
+import mdns
+import asyncio
+import inspect
+
+from ._mDNS import dnssocket
+
+# marks the end of the message stream of a closed listener
+_CLOSED = object()
+
+class MulticastDNSProtocol(asyncio.DatagramProtocol):
+  def __init__(self, queue) -> None:
+    self.queue = queue
+    self.transport = None
+    self.dropped = 0
+    self._tasks = set()
+
+  def connection_made(self, transport):
+    self.transport = transport
+
+  def datagram_received(self, data, addr):
+    # a failing prefilter or decoder only skips the datagram, like in the
+    # receive thread of mdns.startup()
+    try:
+      if mdns._mDNS.PREFILTERS:
+        info = mdns.peek(data)
+        if not all(f(info) for f in mdns._mDNS.PREFILTERS):
+          return
+      packet = mdns.loadm(data)
+    except Exception:
+      return
+
+    self._dispatch(packet, addr)
+    try:
+      self.queue.put_nowait((packet, addr))
+    except asyncio.QueueFull:
+      self.dropped += 1
+
+  # Plain handlers run inline, coroutine handlers are scheduled as tasks
+  # on the running loop.
+  def _dispatch(self, packet, addr):
+    for _h in mdns._mDNS.HANDLER_INDEX.route(packet):
+      try:
+        x = _h(packet, addr)
+        if inspect.isawaitable(x):
+          task = asyncio.ensure_future(x)
+          self._tasks.add(task)
+          task.add_done_callback(self._task_done)
+      except:
+        pass
+
+  def _task_done(self, task):
+    self._tasks.discard(task)
+    if not task.cancelled():
+      task.exception()
+
+  def error_received(self, exc):
+    pass
+
+  def connection_lost(self, exc):
+    try:
+      self.queue.put_nowait(_CLOSED)
+    except asyncio.QueueFull:
+      self.queue.get_nowait()
+      self.queue.put_nowait(_CLOSED)
+
+# Receives decoded messages as (DNSMessage, address) tuples:
+#
+#   async with await mdns.listen() as listener:
+#     await listener.send(mdns.buildm(questions=[...]))
+#     async for packet, addr in listener:
+#       ...
+#
+# Registered handlers are called for every message, whether or not the
+# listener is iterated. If nobody consumes the messages, new ones are
+# dropped once maxsize messages are queued.
+class AsyncListener:
+  def __init__(self, s, transport, protocol) -> None:
+    self.s = s
+    self.transport = transport
+    self.protocol = protocol
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    item = await self.protocol.queue.get()
+    if item is _CLOSED:
+      raise StopAsyncIteration
+    return item
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    self.close()
+
+  # data may be a DNSMessage or already encoded bytes
+  async def send(self, data, address=None) -> None:
+    if type(data) == mdns.DNSMessage:
+      buf = bytearray()
+      mdns.to_bytes(data, buf)
+      data = buf
+    self.transport.sendto(bytes(data), address if address else self.s._address)
+
+  def close(self):
+    self.transport.close()
+
+async def listen(proto='ipv4', address=None, broadcast_ip=None, maxsize=1024) -> AsyncListener:
+  s = dnssocket(proto, address, broadcast_ip)
+  s.sock.setblocking(False)
+
+  loop = asyncio.get_running_loop()
+  queue = asyncio.Queue(maxsize)
+  transport, protocol = await loop.create_datagram_endpoint(
+    lambda: MulticastDNSProtocol(queue), sock=s.sock
+  )
+  return AsyncListener(s, transport, protocol)
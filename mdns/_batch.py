@@ -0,0 +1,91 @@
+import mdns
+
+# Field layout of the structured array returned by loadm_many. The header
+# fields are converted to native byte order, offset/length locate each
+# datagram in the batch buffer.
+HEADER_FIELDS = [
+  ('id', 'u2'),
+  ('flags', 'u2'),
+  ('questionCount', 'u2'),
+  ('answerCount', 'u2'),
+  ('authorityCount', 'u2'),
+  ('additionalCount', 'u2'),
+  ('offset', 'u8'),
+  ('length', 'u4')
+]
+
+# numpy is only needed for the batch API, so it is imported on first use
+def _numpy():
+  try:
+    import numpy
+  except ImportError:
+    raise ImportError('The batch API (mdns.loadm_many) requires numpy') from None
+  return numpy
+
+class DNSMessageBatch:
+  def __init__(self, buffer, headers) -> None:
+    self.buffer = buffer
+    self.headers = headers
+
+  def __len__(self) -> int:
+    return len(self.headers)
+
+  def __str__(self) -> str:
+    return '<DNSMessageBatch count=%d size=%d |>' % (len(self.headers), len(self.buffer))
+
+  def datagram(self, i) -> memoryview:
+    row = self.headers[i]
+    offset = int(row['offset'])
+    return self.buffer[offset:offset + int(row['length'])]
+
+  # full decoding of a single row
+  def loadm(self, i) -> mdns.DNSMessage:
+    return mdns.loadm(self.datagram(i))
+
+  # Decodes only the selected rows, given as a boolean mask or as an
+  # array of row indices. Yields (row, DNSMessage) tuples.
+  def select(self, rows):
+    np = _numpy()
+    rows = np.asarray(rows)
+    if rows.dtype == np.bool_:
+      rows = np.flatnonzero(rows)
+
+    for i in rows:
+      yield (int(i), self.loadm(i))
+
+# Decodes the 12-byte headers of many datagrams in one vectorized step.
+# The datagrams are either a list of bytes-like objects or one buffer
+# together with the offset and length of each datagram. Rows shorter than
+# a header keep zero header fields.
+def loadm_many(datagrams, offsets=None, lengths=None) -> DNSMessageBatch:
+  np = _numpy()
+
+  if type(datagrams) in (list, tuple):
+    lengths = np.fromiter((len(x) for x in datagrams), dtype=np.uint32, count=len(datagrams))
+    offsets = np.zeros(len(datagrams), dtype=np.uint64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    buffer = memoryview(b''.join(datagrams))
+  else:
+    if offsets is None or lengths is None:
+      raise ValueError('offsets and lengths are required for a single buffer')
+    buffer = datagrams if type(datagrams) == memoryview else memoryview(datagrams)
+    offsets = np.asarray(offsets, dtype=np.uint64)
+    lengths = np.asarray(lengths, dtype=np.uint32)
+    if len(offsets) != len(lengths):
+      raise ValueError('offsets and lengths differ in size')
+
+  if len(offsets) > 0 and int((offsets + lengths).max()) > len(buffer):
+    raise IndexError('Datagram exceeds the batch buffer')
+
+  headers = np.zeros(len(offsets), dtype=np.dtype(HEADER_FIELDS))
+  headers['offset'] = offsets
+  headers['length'] = lengths
+
+  valid = lengths >= mdns.DNSMessageHeader.ABS_DNSM_H_LEN
+  raw = np.frombuffer(buffer, dtype=np.uint8)
+  index = offsets[valid].astype(np.intp)[:, None] + np.arange(mdns.DNSMessageHeader.ABS_DNSM_H_LEN)
+  fields = raw[index].view('>u2')
+  for i, (name, _) in enumerate(HEADER_FIELDS[:6]):
+    headers[name][valid] = fields[:, i]
+
+  return DNSMessageBatch(buffer, headers)
@@ -0,0 +1,255 @@
+import mdns
+import asyncio
+import time
+
+from ._cache import RecordCache, name_key
+
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_TXT = 16
+TYPE_AAAA = 28
+TYPE_SRV = 33
+
+# DNS-SD service type enumeration (RFC 6763 9)
+SERVICES_NAME = ('_services', '_dns-sd', '_udp', 'local')
+
+# questions are packed into messages of at most this size
+MAX_MESSAGE_SIZE = 1400
+
+class ServiceInfo:
+  __slots__ = ('name', 'type', 'host', 'port', 'addresses', 'txt', 'source')
+
+  def __init__(self, name, type, host=None, port=0, addresses=None, txt=None, source=None) -> None:
+    self.name = name
+    self.type = type
+    self.host = host
+    self.port = port
+    self.addresses = addresses if addresses else []
+    self.txt = txt if txt else []
+    self.source = source
+
+  def __str__(self) -> str:
+    s = "<ServiceInfo "
+    for k in self.__slots__:
+      s += '%s=%s ' % (k, getattr(self, k))
+    return s + '|>'
+
+# Browses DNS-SD services (RFC 6763) and resolves every instance to its
+# SRV, TXT and address records:
+#
+#   PTR <type> -> instance -> SRV (host, port) + TXT -> A/AAAA of the host
+#
+# All received responses go into a RecordCache, so records that arrive in
+# the additional section (or were cached before) are used right away and
+# only the missing ones are queried. Questions that become necessary while
+# a burst of responses is processed are collected for delay seconds and
+# sent together in as few messages as possible; unanswered questions are
+# repeated after retry seconds. Cached records are sent along as known
+# answers, so browsing again with the same cache only brings up changes.
+#
+# types: service types like '_http._tcp' ('.local' is appended), None
+# browses every type announced via _services._dns-sd._udp.local.
+class ServiceBrowser:
+  def __init__(self, types=None, cache=None, delay=0.02, retry=1.0) -> None:
+    self.cache = cache if cache is not None else RecordCache()
+    self.delay = delay
+    self.retry = retry
+    self.enumerate = not types
+    # name keys of the browsed service types
+    self.types = set()
+    for t in (types or ()):
+      key = name_key(t)
+      self.types.add(key if key[-1:] == ('local',) else key + ('local',))
+
+    # instance key -> (instance name, type key); resolved: yielded instances
+    self.instances = {}
+    self.resolved = set()
+    # (name key, type) -> time the question was sent
+    self.asked = {}
+    # (name key, type) of the questions to send with the next message
+    self.pending = {}
+    self._pending_since = None
+    self.sent = 0
+
+  def __str__(self) -> str:
+    return '<ServiceBrowser types=%d instances=%d resolved=%d sent=%d |>' % (
+      len(self.types), len(self.instances), len(self.resolved), self.sent
+    )
+
+  def _need(self, name, rrtype, now):
+    key = (name, rrtype)
+    if key in self.pending:
+      return
+    last = self.asked.get(key)
+    if last is None or now - last >= self.retry:
+      if not self.pending:
+        self._pending_since = now
+      self.pending[key] = None
+
+  # Follows the cached records as far as possible. Returns the instances
+  # that are resolved now and asks for whatever is missing.
+  def advance(self, now=None) -> list:
+    if now is None:
+      now = time.monotonic()
+    cache = self.cache
+
+    if self.enumerate:
+      ptrs = cache.get(SERVICES_NAME, TYPE_PTR)
+      for record in ptrs:
+        self.types.add(name_key(record.rdata.name))
+      if not ptrs:
+        self._need(SERVICES_NAME, TYPE_PTR, now)
+
+    for t in self.types:
+      ptrs = cache.get(t, TYPE_PTR)
+      for record in ptrs:
+        key = name_key(record.rdata.name)
+        if key not in self.instances:
+          self.instances[key] = (str(record.rdata.name), t)
+      if not ptrs:
+        self._need(t, TYPE_PTR, now)
+
+    result = []
+    for key, (name, t) in self.instances.items():
+      if key in self.resolved:
+        continue
+
+      srv = cache.entries(key, TYPE_SRV)
+      txt = cache.get(key, TYPE_TXT)
+      if not srv:
+        self._need(key, TYPE_SRV, now)
+      if not txt:
+        self._need(key, TYPE_TXT, now)
+      if not srv:
+        continue
+
+      target = name_key(srv[0].record.rdata.target)
+      addresses = [r.rdata.addr for r in cache.get(target, TYPE_A) + cache.get(target, TYPE_AAAA)]
+      if not addresses:
+        self._need(target, TYPE_A, now)
+        self._need(target, TYPE_AAAA, now)
+        continue
+      if not txt:
+        continue
+
+      self.resolved.add(key)
+      rdata = srv[0].record.rdata
+      result.append(ServiceInfo(name, '.'.join(t), str(rdata.target), rdata.port,
+                                addresses, txt[0].rdata.strings, srv[0].source))
+    return result
+
+  # Returns the encoded messages for the pending questions.
+  def flush(self, now=None) -> list:
+    if now is None:
+      now = time.monotonic()
+
+    messages = []
+    questions = []
+    size = 12
+    for name, rrtype in self.pending:
+      self.asked[(name, rrtype)] = now
+      qsize = sum(len(x.encode('utf-8')) + 1 for x in name) + 5
+      if questions and size + qsize > MAX_MESSAGE_SIZE:
+        messages.append(questions)
+        questions = []
+        size = 12
+      questions.append(mdns.buildq(list(name), rrtype))
+      size += qsize
+    if questions:
+      messages.append(questions)
+
+    self.pending = {}
+    self._pending_since = None
+    result = []
+    for questions in messages:
+      result.extend(self._pack(questions, self.cache.known_answers(questions, now)))
+    self.sent += len(result)
+    return result
+
+  # Encodes questions with their known answers. Answers that do not fit
+  # go into follow-up messages without questions; all but the last have
+  # the TC bit set, so responders wait for the rest (RFC 6762 7.2).
+  def _pack(self, questions, answers) -> list:
+    # the records are written as they would be in the message, so the
+    # sizes include name compression; a record that does not fit starts
+    # the next message
+    groups = [[]]
+    buf = bytearray(12)
+    names = {}
+    for q in questions:
+      mdns.to_bytes(q, buf, names)
+    for record in answers:
+      mdns.to_bytes(record, buf, names)
+      if groups[-1] and len(buf) > MAX_MESSAGE_SIZE:
+        groups.append([])
+        buf = bytearray(12)
+        names = {}
+        mdns.to_bytes(record, buf, names)
+      groups[-1].append(record)
+
+    result = []
+    for i, group in enumerate(groups):
+      flags = mdns.types.FLAG_TC_BIT if i < len(groups) - 1 else 0
+      buf = bytearray()
+      mdns.to_bytes(mdns.buildm(flags=flags, questions=questions if i == 0 else None,
+                                answers=group), buf)
+      result.append(bytes(buf))
+    return result
+
+  # Asks for the PTR records of all browsed types, even if some are
+  # cached: the cached ones are sent as known answers, so only new
+  # instances are answered.
+  def query_types(self, now=None):
+    if now is None:
+      now = time.monotonic()
+    names = list(self.types)
+    if self.enumerate:
+      names.append(SERVICES_NAME)
+    for name in names:
+      if not self.pending:
+        self._pending_since = now
+      self.pending[(name, TYPE_PTR)] = None
+
+  # Streams resolved services for timeout seconds. listener is an
+  # AsyncListener (see mdns.listen).
+  async def browse(self, listener, timeout=3.0):
+    end = time.monotonic() + timeout
+    self.query_types()
+    for info in self.advance():
+      yield info
+
+    while True:
+      now = time.monotonic()
+      if self.pending and now - self._pending_since >= self.delay:
+        for data in self.flush(now):
+          await listener.send(data)
+      if now >= end:
+        break
+
+      wait = end - now
+      if self.pending:
+        wait = min(wait, max(0, self._pending_since + self.delay - now))
+      else:
+        wait = min(wait, self.retry)
+
+      try:
+        packet, addr = await asyncio.wait_for(listener.__anext__(), wait)
+        if packet.h.flags & mdns.types.FLAG_QR:
+          self.cache.update(packet, addr)
+      except asyncio.TimeoutError:
+        pass
+      except StopAsyncIteration:
+        break
+
+      for info in self.advance():
+        yield info
+
+# Browses on a new listener, see ServiceBrowser:
+#
+#   async for info in mdns.browse(['_airplay._tcp']):
+#     print(info)
+async def browse(types=None, timeout=3.0, cache=None, proto='ipv4', address=None):
+  browser = ServiceBrowser(types, cache)
+  async with await mdns.listen(proto, address) as listener:
+    async for info in browser.browse(listener, timeout):
+      yield info
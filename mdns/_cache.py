@@ -0,0 +1,239 @@
+import heapq
+import threading
+import time
+
+from ._route import _lower
+from ._rr import DomainName, ResourceRecord
+from ._stdrr import RDATA_ENCODERS
+
+TYPE_OPT = 41
+TYPE_ANY = 255
+CLASS_MASK = 0x7FFF
+
+# RFC 6762 10.1/10.2: goodbye records and records replaced by a cache-flush
+# record are kept for one more second
+GRACE_PERIOD = 1.0
+
+# Returns the case-insensitive key of a name given as DomainName, label
+# sequence or dotted string.
+def name_key(name) -> tuple:
+  if type(name) == DomainName:
+    return _lower(tuple(name.raw_name))
+  if type(name) == str:
+    return _lower(tuple(x for x in name.strip('.').split('.') if x))
+  return _lower(tuple(name))
+
+# Returns a hashable key for the value of a record's rdata: memoryviews
+# become bytes, names their name_key() and RData/OPT objects the tuple of
+# their fields.
+def rdata_key(value):
+  if value is None or type(value) in (int, str, bytes):
+    return value
+  if type(value) in (memoryview, bytearray):
+    return bytes(value)
+  if type(value) == DomainName:
+    return name_key(value)
+  if type(value) in (list, tuple):
+    return tuple(rdata_key(x) for x in value)
+  if hasattr(value, 'fields'):
+    return (type(value).__name__,) + tuple(rdata_key(getattr(value, k)) for k in value.fields())
+  if hasattr(type(value), '__slots__'):
+    return (type(value).__name__,) + tuple(rdata_key(getattr(value, k)) for k in value.__slots__)
+  return value
+
+class CacheEntry:
+  __slots__ = ('record', 'key', 'ttl', 'created', 'expires', 'source')
+
+  def __init__(self, record, key, now, source=None) -> None:
+    self.record = record
+    self.key = key
+    self.ttl = record.ttl
+    self.created = now
+    self.expires = now + record.ttl
+    self.source = source
+
+  def __str__(self) -> str:
+    return '<CacheEntry name=%s type=%d ttl=%d expires=%.3f source=%s |>' % (
+      '.'.join(self.key[0]), self.key[1], self.ttl, self.expires, self.source
+    )
+
+  # seconds until the entry expires
+  def remaining(self, now=None) -> float:
+    return self.expires - (time.monotonic() if now is None else now)
+
+# Keeps received resource records until their TTL runs out. Entries are
+# keyed by (name, type, class, rdata); lookups by name and type are a dict
+# access. Expiry times are kept in a min-heap, so expire() only looks at
+# the entries that are due.
+#
+# The cache-flush bit and TTL=0 goodbyes are handled as described in RFC
+# 6762: records that are flushed or said goodbye to expire one second
+# later. Records decoded from a RecvRing slot must be copied before they
+# are cached (see mdns.RecvRing).
+#
+# Use it as a handler to keep it up to date:
+#
+#   cache = mdns.RecordCache()
+#   mdns.handler(cache.update)
+class RecordCache:
+  def __init__(self) -> None:
+    # key -> CacheEntry
+    self._entries = {}
+    # (name, type) -> {key: CacheEntry}
+    self._by_name = {}
+    # (expires, key) - outdated items are skipped when popped
+    self._heap = []
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def __str__(self) -> str:
+    return '<RecordCache entries=%d names=%d heap=%d |>' % (
+      len(self._entries), len(self._by_name), len(self._heap)
+    )
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._by_name.clear()
+      self._heap.clear()
+
+  # Adds all records of a decoded message.
+  def update(self, packet, addr=None, now=None) -> int:
+    if now is None:
+      now = time.monotonic()
+    source = addr[0] if addr else None
+
+    count = 0
+    for section in (packet.answers, packet.authorities, packet.additionalRR):
+      for record in section:
+        count += self.add(record, now, source)
+    return count
+
+  # Adds or refreshes a record. Returns 1 if the cache changed.
+  def add(self, record, now=None, source=None) -> int:
+    if record.type == TYPE_OPT or type(record.name) != DomainName:
+      return 0
+    if now is None:
+      now = time.monotonic()
+
+    name = name_key(record.name)
+    clazz = record.clazz & CLASS_MASK
+    key = (name, record.type, clazz, rdata_key(record.rdata))
+
+    with self._lock:
+      self._expire(now)
+      entry = self._entries.get(key)
+      if record.ttl == 0:
+        # goodbye: the record goes away after the grace period
+        if entry is None:
+          return 0
+        self._reschedule(entry, min(entry.expires, now + GRACE_PERIOD))
+        return 1
+
+      if record.has_cache_flush():
+        # other data of this name/type/class that was not received within
+        # the last second is outdated
+        for other in self._by_name.get((name, record.type), {}).values():
+          if other.key != key and other.key[2] == clazz and other.created < now - GRACE_PERIOD:
+            self._reschedule(other, min(other.expires, now + GRACE_PERIOD))
+
+      if entry is None:
+        entry = CacheEntry(record, key, now, source)
+        self._entries[key] = entry
+        self._by_name.setdefault((name, record.type), {})[key] = entry
+      else:
+        entry.record = record
+        entry.ttl = record.ttl
+        entry.created = now
+        entry.source = source
+      self._reschedule(entry, now + record.ttl)
+      return 1
+
+  def _reschedule(self, entry, expires):
+    entry.expires = expires
+    heapq.heappush(self._heap, (expires, entry.key))
+
+  # Returns the live entries of a name and type (optionally class).
+  def entries(self, name, rrtype, clazz=None, now=None) -> list:
+    if now is None:
+      now = time.monotonic()
+    with self._lock:
+      self._expire(now)
+      bucket = self._by_name.get((name_key(name), rrtype))
+      if not bucket:
+        return []
+      return [x for x in bucket.values() if clazz is None or x.key[2] == (clazz & CLASS_MASK)]
+
+  # Returns the live records of a name and type.
+  def get(self, name, rrtype, clazz=None, now=None) -> list:
+    return [x.record for x in self.entries(name, rrtype, clazz, now)]
+
+  # Returns the known answers to include with the given questions (RFC
+  # 6762 7.1): the cached records that still have more than half of their
+  # TTL left, as copies with the remaining TTL and no cache-flush bit.
+  # Questions for ANY match every type of the name. Records that can not
+  # be encoded (e.g. of a type without decoder) are left out.
+  def known_answers(self, questions, now=None) -> list:
+    if now is None:
+      now = time.monotonic()
+
+    result = []
+    seen = set()
+    with self._lock:
+      self._expire(now)
+      for q in questions:
+        name = name_key(q.qname)
+        if q.qtype == TYPE_ANY:
+          buckets = [v for k, v in self._by_name.items() if k[0] == name]
+        else:
+          buckets = [self._by_name.get((name, q.qtype), {})]
+
+        qclass = q.qclass & CLASS_MASK
+        for bucket in buckets:
+          for entry in bucket.values():
+            remaining = entry.remaining(now)
+            if entry.key in seen or entry.key[2] != qclass or remaining <= entry.ttl / 2:
+              continue
+            if type(entry.record.rdata) not in RDATA_ENCODERS:
+              continue
+            seen.add(entry.key)
+            result.append(_known_answer(entry.record, int(remaining)))
+    return result
+
+  # Removes expired entries and returns how many were removed.
+  def expire(self, now=None) -> int:
+    with self._lock:
+      return self._expire(time.monotonic() if now is None else now)
+
+  def _expire(self, now) -> int:
+    heap = self._heap
+    count = 0
+    while heap and heap[0][0] <= now:
+      expires, key = heapq.heappop(heap)
+      entry = self._entries.get(key)
+      if entry is None or entry.expires != expires:
+        # removed or rescheduled in the meantime
+        continue
+
+      del self._entries[key]
+      bucket = self._by_name[(key[0], key[1])]
+      del bucket[key]
+      if not bucket:
+        del self._by_name[(key[0], key[1])]
+      count += 1
+
+    # rescheduling leaves outdated items behind; rebuild when they dominate
+    if len(heap) > 64 and len(heap) > 4 * len(self._entries):
+      self._heap = [(x.expires, x.key) for x in self._entries.values()]
+      heapq.heapify(self._heap)
+    return count
+
+def _known_answer(record, ttl) -> ResourceRecord:
+  answer = ResourceRecord()
+  for k in ResourceRecord.__slots__:
+    setattr(answer, k, getattr(record, k))
+  answer.ttl = ttl
+  answer.clazz = record.clazz & CLASS_MASK
+  return answer
@@ -0,0 +1,114 @@
+import queue
+import threading
+
+# What submit() does when the queue is full
+POLICY_BLOCK = 'block'              # wait for a free slot
+POLICY_DROP_NEWEST = 'drop-newest'  # discard the submitted item
+POLICY_DROP_OLDEST = 'drop-oldest'  # discard the oldest queued item
+
+POLICIES = (POLICY_BLOCK, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST)
+
+# marks the end of work for one worker thread
+_STOP = object()
+
+# Decouples a receive loop from handler execution: items are put on a
+# bounded queue and processed by a pool of worker threads, so a slow
+# handler no longer stalls the socket.
+class Dispatcher:
+  def __init__(self, workers=4, maxsize=1024, policy=POLICY_BLOCK) -> None:
+    if policy not in POLICIES:
+      raise ValueError("Invalid policy - expected one of {}".format(POLICIES))
+    if workers < 1:
+      raise ValueError('At least one worker is required')
+
+    self.workers = workers
+    self.policy = policy
+    self.queue = queue.Queue(maxsize)
+    self.target = None
+    self._threads = []
+    self._lock = threading.Lock()
+
+    # updated by the submitting thread
+    self.submitted = 0
+    self.blocked = 0
+    self.dropped_newest = 0
+    self.dropped_oldest = 0
+    # updated by the workers (under _lock)
+    self.processed = 0
+    self.errors = 0
+
+  def __str__(self) -> str:
+    return ('<Dispatcher policy=%s workers=%d queued=%d submitted=%d processed=%d '
+            'blocked=%d dropped_newest=%d dropped_oldest=%d errors=%d |>') % (
+      self.policy, self.workers, self.queue.qsize(), self.submitted, self.processed,
+      self.blocked, self.dropped_newest, self.dropped_oldest, self.errors
+    )
+
+  def running(self) -> bool:
+    return len(self._threads) > 0
+
+  # target is called as target(*item) for every submitted item
+  def start(self, target):
+    if self.running():
+      raise RuntimeError('Dispatcher already started')
+
+    self.target = target
+    for i in range(self.workers):
+      th = threading.Thread(target=self._work, name='mdns-dispatch-%d' % i, daemon=True)
+      th.start()
+      self._threads.append(th)
+
+  # Returns False if the item was dropped.
+  def submit(self, item) -> bool:
+    self.submitted += 1
+    try:
+      self.queue.put_nowait(item)
+      return True
+    except queue.Full:
+      pass
+
+    if self.policy == POLICY_BLOCK:
+      self.blocked += 1
+      self.queue.put(item)
+      return True
+
+    if self.policy == POLICY_DROP_NEWEST:
+      self.dropped_newest += 1
+      return False
+
+    while True:
+      try:
+        self.queue.get_nowait()
+        self.dropped_oldest += 1
+      except queue.Empty:
+        pass
+      try:
+        self.queue.put_nowait(item)
+        return True
+      except queue.Full:
+        continue
+
+  # Lets the workers finish the queued items and waits for them.
+  def stop(self, timeout=None):
+    for th in self._threads:
+      self.queue.put(_STOP)
+    for th in self._threads:
+      th.join(timeout)
+    self._threads = []
+
+  def _work(self):
+    while True:
+      item = self.queue.get()
+      if item is _STOP:
+        break
+
+      try:
+        self.target(*item)
+        ok = True
+      except Exception:
+        ok = False
+
+      with self._lock:
+        self.processed += 1
+        if not ok:
+          self.errors += 1
@@ -0,0 +1,79 @@
+import threading
+
+# A bounded pool of canonical objects. Interning an object returns the
+# instance that was stored first for an equal key, so equal labels and
+# names decoded from different packets share one object.
+#
+# A hit is a plain dict lookup that sets the entry's reference bit; the
+# lock is only taken to insert. Once maxsize is reached, entries are
+# evicted with the CLOCK (second chance) approximation of LRU: the hand
+# skips - and clears - entries that were hit since it last passed them.
+# hits is counted without the lock and may miss a few concurrent hits.
+class InternPool:
+  def __init__(self, maxsize=65536) -> None:
+    if maxsize < 1:
+      raise ValueError('maxsize must be at least 1')
+
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    # obj -> [obj, referenced]
+    self._items = {}
+    # the entries in clock order
+    self._clock = []
+    self._hand = 0
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._items)
+
+  def __str__(self) -> str:
+    return '<InternPool size=%d maxsize=%d hits=%d misses=%d hit_rate=%.3f |>' % (
+      len(self._items), self.maxsize, self.hits, self.misses, self.hit_rate()
+    )
+
+  def intern(self, obj):
+    entry = self._items.get(obj)
+    if entry is not None:
+      entry[1] = True
+      self.hits += 1
+      return entry[0]
+    return self._insert(obj)
+
+  def _insert(self, obj):
+    with self._lock:
+      entry = self._items.get(obj)
+      if entry is not None:
+        # inserted by another thread in the meantime
+        return entry[0]
+
+      self.misses += 1
+      entry = [obj, False]
+      clock = self._clock
+      if len(clock) < self.maxsize:
+        clock.append(entry)
+      else:
+        hand = self._hand
+        while clock[hand][1]:
+          clock[hand][1] = False
+          hand = (hand + 1) % len(clock)
+        del self._items[clock[hand][0]]
+        clock[hand] = entry
+        self._hand = (hand + 1) % len(clock)
+      self._items[obj] = entry
+      return obj
+
+  def hit_rate(self) -> float:
+    total = self.hits + self.misses
+    return self.hits / total if total else 0.0
+
+  def clear(self):
+    with self._lock:
+      self._items.clear()
+      self._clock = []
+      self._hand = 0
+      self.hits = 0
+      self.misses = 0
+
+# used by the decoders in mdns._rr for labels and fully-qualified names
+NAME_POOL = InternPool()
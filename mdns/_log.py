@@ -0,0 +1,187 @@
+import os
+import struct
+import tempfile
+import time
+
+from ._pcap import PcapReader, PcapWriter, udp_payload, LINKTYPE_RAW
+
+# one index entry per packet: file offset of the pcap record, timestamp
+_INDEX = struct.Struct('<Qd')
+_RECORD = struct.Struct('<IIII')
+
+INDEX_SUFFIX = '.idx'
+
+# An append-only log of received datagrams. The datagrams are stored in a
+# pcap file (see mdns.PcapWriter) and every record gets a fixed-width entry
+# in a separate index file (path + '.idx'), so packet n can be read back
+# with two seeks - independent of the size of the log and without keeping
+# anything in memory.
+#
+# mode 'w' creates a new log, mode 'r' opens an existing one read-only.
+class PacketLog:
+  def __init__(self, path, mode='w') -> None:
+    if mode not in ('w', 'r'):
+      raise ValueError("Invalid mode - expected one of {}".format(('w', 'r')))
+
+    self.path = path
+    self.index_path = path + INDEX_SUFFIX
+    self.mode = mode
+    self._writer = None
+    self._index = None
+    if mode == 'w':
+      self._writer = PcapWriter(path)
+      self._index = open(self.index_path, 'wb', buffering=1 << 16)
+      self.count = 0
+    else:
+      self.count = os.path.getsize(self.index_path) // _INDEX.size
+
+    # read handles are opened on first access
+    self._data_reader = None
+    self._index_reader = None
+
+  def __len__(self) -> int:
+    return self.count
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __str__(self) -> str:
+    return '<PacketLog path=%s mode=%s count=%d |>' % (self.path, self.mode, self.count)
+
+  # Appends a datagram received from address and returns its number.
+  def append(self, data, address=None, timestamp=None) -> int:
+    if self._writer is None:
+      raise ValueError('PacketLog is read-only')
+    if timestamp is None:
+      timestamp = time.time()
+
+    offset = self._writer.write(data, address, timestamp)
+    self._index.write(_INDEX.pack(offset, timestamp))
+    self.count += 1
+    return self.count - 1
+
+  # Returns (offset, timestamp) of packet n.
+  def entry(self, n) -> tuple:
+    if not 0 <= n < self.count:
+      raise IndexError('Packet number out of range: %d' % (n))
+    self._sync()
+    self._index_reader.seek(n * _INDEX.size)
+    return _INDEX.unpack(self._index_reader.read(_INDEX.size))
+
+  # Returns (timestamp, source, data) of packet n.
+  def get(self, n) -> tuple:
+    offset, timestamp = self.entry(n)
+    self._data_reader.seek(offset)
+    incl_len = _RECORD.unpack(self._data_reader.read(_RECORD.size))[2]
+    frame = self._data_reader.read(incl_len)
+    r = udp_payload(frame, LINKTYPE_RAW, _dport(frame))
+    if r is None:
+      raise ValueError('Invalid record at offset %d' % (offset))
+    return (timestamp, r[0], bytes(r[1]))
+
+  # Decodes packet n.
+  def loadm(self, n):
+    from ._mDNSCommon import loadm
+    return loadm(self.get(n)[2])
+
+  def __iter__(self):
+    for n in range(self.count):
+      yield self.get(n)
+
+  def _sync(self):
+    if self._writer is not None:
+      self._writer.flush()
+      self._index.flush()
+    if self._data_reader is None:
+      self._data_reader = open(self.path, 'rb')
+      self._index_reader = open(self.index_path, 'rb')
+
+  def close(self):
+    for f in (self._writer, self._index, self._data_reader, self._index_reader):
+      if f is not None:
+        f.close()
+    self._writer = self._index = self._data_reader = self._index_reader = None
+
+# approximate memory used by a buffered datagram besides its bytes
+_ITEM_OVERHEAD = 128
+
+# A FIFO of received datagrams with a memory budget. Datagrams are kept in
+# memory until they use more than max_memory bytes; then the buffered ones
+# are spilled to a temporary pcap file (in directory, default: the system's
+# temp directory). Iteration yields (timestamp, source, data) in the order
+# of append(), reading the spilled part back from disk.
+class SpillBuffer:
+  def __init__(self, max_memory=256 << 20, directory=None) -> None:
+    self.max_memory = max_memory
+    self.directory = directory
+    self.memory = 0
+    self.count = 0
+    self.spilled = 0
+    self.path = None
+    self._items = []
+    self._writer = None
+
+  def __len__(self) -> int:
+    return self.count
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __str__(self) -> str:
+    return '<SpillBuffer count=%d memory=%d spilled=%d path=%s |>' % (
+      self.count, self.memory, self.spilled, self.path
+    )
+
+  def append(self, data, address=None, timestamp=None):
+    if timestamp is None:
+      timestamp = time.time()
+    data = bytes(data)
+    self._items.append((timestamp, address, data))
+    self.memory += len(data) + _ITEM_OVERHEAD
+    self.count += 1
+    if self.memory > self.max_memory:
+      self._spill()
+
+  def _spill(self):
+    if self._writer is None:
+      fd, self.path = tempfile.mkstemp(prefix='mdns-spill-', suffix='.pcap', dir=self.directory)
+      os.close(fd)
+      self._writer = PcapWriter(self.path)
+
+    for timestamp, address, data in self._items:
+      self._writer.write(data, address, timestamp)
+    self.spilled += len(self._items)
+    self._items = []
+    self.memory = 0
+
+  def __iter__(self):
+    if self._writer is not None:
+      self._writer.flush()
+      with PcapReader(self.path) as reader:
+        for timestamp, source, data in reader:
+          yield (timestamp, source, bytes(data))
+
+    for timestamp, address, data in self._items:
+      yield (timestamp, address[0] if address else '0.0.0.0', data)
+
+  # Drops the buffered datagrams and removes the temporary file.
+  def close(self):
+    if self._writer is not None:
+      self._writer.close()
+      os.remove(self.path)
+      self._writer = None
+      self.path = None
+    self._items = []
+    self.memory = 0
+
+def _dport(frame) -> int:
+  # the records are written by PcapWriter, so the UDP header follows a
+  # plain IPv4 or IPv6 header
+  index = 20 if frame[0] >> 4 == 4 else 40
+  return struct.unpack_from('!H', frame, index + 2)[0]
@@ -1,17 +1,55 @@
 import mdns
-import socket
 import struct
 import threading
+import types
+
+from ._route import HandlerIndex
 
 HANDLERS = []
+HANDLER_INDEX = HandlerIndex()
+
+# Predicates over mdns.peek() results. A datagram is only decoded and
+# handed to the handlers if every prefilter accepts it.
+PREFILTERS = []
+
+# Registers a handler, either for every message (@mdns.handler) or only
+# for messages with matching records:
+#
+#   @mdns.handler(rrtype=12, section='answers', suffix='_airplay._tcp.local')
+#   def on_airplay(packet, addr):
+#     ...
+#
+# rrtype: record type, section: 'questions', 'answers', 'authorities' or
+# 'additionalRR', qr: 'query' or 'response', suffix: name suffix (the
+# comparison ignores case). A handler is called at most once per message.
+def handler(func=None, rrtype=None, section=None, qr=None, suffix=None):
+  def register(f):
+    HANDLER_INDEX.subscribe(f, rrtype, section, qr, suffix)
+    if f not in HANDLERS:
+      HANDLERS.append(f)
+    return f
+
+  if func is None:
+    return register
+  return register(func)
+
+def remove_handler(func):
+  HANDLER_INDEX.unsubscribe(func)
+  if func in HANDLERS:
+    HANDLERS.remove(func)
 
-def handler(func):
-  if func not in HANDLERS:
-    HANDLERS.append(func)
+def prefilter(func):
+  if func not in PREFILTERS:
+    PREFILTERS.append(func)
   return func
 
+# Owns one UDP socket bound to port 5353 that joined the mDNS group. Use
+# it as a context manager to close it deterministically.
 class dnssocket:
   def __init__(self, proto='ipv4', address=None, broadcast_ip=None) -> None:
+    # socket is imported lazily so that 'import mdns' stays cheap
+    import socket
+
     if proto not in ('ipv4', 'ipv6'):
       raise ValueError("Invalid proto - expected one of {}".format(('ipv4', 'ipv6')))
 
@@ -42,30 +80,112 @@ class dnssocket:
 
     self.sock.bind((bind_address, 5353)) 
 
-MDNS_SOCKET = dnssocket()
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def close(self):
+    self.sock.close()
+
+  def closed(self) -> bool:
+    return self.sock.fileno() < 0
+
+# The default socket is only created on first use (send/listen), so that
+# importing mdns stays free of side effects. mdns.MDNS_SOCKET resolves to
+# it as well.
+_default_socket = None
+_default_lock = threading.Lock()
 
-def sendN(data, s=MDNS_SOCKET):
+def get_socket() -> dnssocket:
+  global _default_socket
+  with _default_lock:
+    if _default_socket is None or _default_socket.closed():
+      _default_socket = dnssocket()
+    return _default_socket
+
+def close_socket():
+  global _default_socket
+  with _default_lock:
+    if _default_socket is not None:
+      _default_socket.close()
+      _default_socket = None
+
+def __getattr__(name):
+  if name == 'MDNS_SOCKET':
+    return get_socket()
+  raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+def sendN(data, s=None):
+  if s is None:
+    s = get_socket()
   return s.sock.sendto(data, s._address)
 
-def startup(s=MDNS_SOCKET, count=-1):
-  th = threading.Thread(target=__thread_delegate, args=(s, count))
+# count < 0 receives until an error occurs. With a RecvRing, datagrams
+# are drained in batches into its preallocated slots; the messages handed
+# to the handlers then point into the ring and must be copied by handlers
+# that keep them (see mdns.RecvRing).
+#
+# With a Dispatcher, the receive thread only applies the prefilters and
+# queues the datagrams; decoding and the handlers run on the dispatcher's
+# worker threads (datagrams from a ring are copied before queueing).
+def startup(s=None, count=-1, ring=None, dispatcher=None):
+  if s is None:
+    s = get_socket()
+  if dispatcher is not None and not dispatcher.running():
+    dispatcher.start(__process)
+
+  th = threading.Thread(target=__thread_delegate, args=(s, count, ring, dispatcher))
   th.start()
+  return th
+
+# largest mDNS message (RFC 6762 17), same as the RecvRing slot size
+MAX_DATAGRAM = 9000
 
-def __thread_delegate(s=MDNS_SOCKET, count=-1):
-  try:
-    c = 0
-    while c < count and count > 0:
-      data, address = s.sock.recvfrom(1024)
-      packet = mdns.loadm(data)
-      __delegate_exec(packet, address)
+# Receive errors stop the loop; datagrams that can not be decoded and
+# failing handlers only skip the datagram.
+def __thread_delegate(s, count=-1, ring=None, dispatcher=None):
+  c = 0
+  while count < 0 or c < count:
+    try:
+      if ring is None:
+        batch = (s.sock.recvfrom(MAX_DATAGRAM),)
+      else:
+        batch = ring.receive(s.sock)
+    except Exception as e:
+      print('Stopped at <Exception e="%s" |>' % (e))
+      return
+
+    for data, address in batch:
+      if 0 <= count <= c:
+        break
       c += 1
-  except Exception as e:
-    print('Stopped at <Exception e="%s" |>' % (e))
+      try:
+        if PREFILTERS:
+          info = mdns.peek(data)
+          if not all(f(info) for f in PREFILTERS):
+            continue
+
+        if dispatcher is not None:
+          dispatcher.submit((data if ring is None else bytes(data), address))
+        else:
+          __process(data, address)
+      except Exception:
+        continue
+
+def __process(data, addr):
+  packet = mdns.loadm(data)
+  __delegate_exec(packet, addr)
 
 def __delegate_exec(packet, addr):
-  for _h in HANDLERS:
+  for _h in HANDLER_INDEX.route(packet):
     try:
-      _h(packet, addr)
+      x = _h(packet, addr)
+      # coroutine handlers outside of an event loop (see mdns.listen)
+      if type(x) == types.CoroutineType:
+        import asyncio
+        asyncio.run(x)
     except:
       pass
 
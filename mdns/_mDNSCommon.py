@@ -1,4 +1,7 @@
 import mdns
+import struct
+
+from collections import namedtuple
 
 class DNSMessageHeader:
 
@@ -34,36 +37,192 @@ class DNSMessage:
         s += '%s=%s ' % (k, getattr(self, k))
     return s + '|>'
 
-def loadm(data: bytes) -> DNSMessage:
-  if len(data) < DNSMessageHeader.ABS_DNSM_H_LEN:
-    raise IndexError('data.len < 12')
+# A read-only sequence over one resource record section. Only the start
+# offsets of the records are known up front, each record is decoded on
+# first access and kept afterwards. The compression table is shared with
+# the other sections of the same message.
+class LazySection:
+  def __init__(self, data, offsets, table=None) -> None:
+    self.data = data
+    self.offsets = offsets
+    self.table = {} if table is None else table
+    self._records = [None] * len(offsets)
+
+  def __len__(self) -> int:
+    return len(self.offsets)
+
+  def __getitem__(self, i):
+    if type(i) == slice:
+      return [self[x] for x in range(*i.indices(len(self.offsets)))]
+
+    _x = self._records[i]
+    if _x is None:
+      _x = mdns.get_resource(self.data, self.offsets[i], self.table)
+      self._records[i] = _x
+    return _x
+
+  def __iter__(self):
+    for i in range(len(self.offsets)):
+      yield self[i]
 
-  _head = data[:DNSMessageHeader.ABS_DNSM_H_LEN]
-  _message = DNSMessage(DNSMessageHeader(), data[DNSMessageHeader.ABS_DNSM_H_LEN:])
+  def __str__(self) -> str:
+    return str(list(self))
+
+  # Yields (type, raw_name) of every record. Records that were not
+  # accessed yet are not decoded: only their owner name and type are read.
+  def owners(self):
+    data = self.data
+    for i, offset in enumerate(self.offsets):
+      _x = self._records[i]
+      if _x is not None:
+        yield (_x.type, _x.name.raw_name if type(_x.name) == mdns.DomainName else ())
+        continue
+
+      index, name = mdns.get_qname(data, offset, self.table)
+      if index + 2 > len(data):
+        raise IndexError('Truncated resource record')
+      yield (_RRTYPE(data, index)[0], name.raw_name)
+
+_HEADER = struct.Struct('!HHHHHH').unpack_from
+_RDLENGTH = struct.Struct('!H').unpack_from
+_RRTYPE = _RDLENGTH
 
-  _message.h.id = mdns.u16(_head)
-  _message.h.flags = mdns.u16(_head, 2)
+def _skip_name(data, offset) -> int:
+  while True:
+    _c0 = data[offset]
+    if _c0 == 0x00:
+      return offset + 1
+    if _c0 & 0xc0 == 0xc0:
+      return offset + 2
+    offset += _c0 + 1
+
+# Records the start offset of each resource record without decoding it.
+def _scan_section(data, offset, count) -> tuple:
+  offsets = []
+  for c in range(count):
+    offsets.append(offset)
+    index = _skip_name(data, offset) + 10
+    if index > len(data):
+      raise IndexError('Truncated resource record')
+    offset = index + _RDLENGTH(data, index - 2)[0]
+    if offset > len(data):
+      raise IndexError('Truncated resource data')
+  return (offsets, offset)
+
+# All decoders work on one memoryview of the original datagram and use
+# absolute offsets, so compression pointers can be followed as-is. Raw
+# payloads (e.g. TXT or NULL rdata) stay memoryview slices of that
+# datagram - use bytes() on them if a copy is needed.
+#
+# Header and questions are decoded immediately, the answer, authority and
+# additional sections are LazySection objects that decode a record only
+# when it is accessed.
+def loadm(data) -> DNSMessage:
+  view = data if type(data) == memoryview else memoryview(data)
+  if view.format != 'B' or view.ndim != 1:
+    view = view.cast('B')
+
+  if len(view) < DNSMessageHeader.ABS_DNSM_H_LEN:
+    raise IndexError('data.len < 12')
 
-  count = [mdns.u16(_head, 4), mdns.u16(_head, 6), mdns.u16(_head, 8), mdns.u16(_head, 10)]
-  _message.h.questionCount = count[0]
-  _message.h.answerCount = count[1]
-  _message.h.authorityCount = count[2]
-  _message.h.additionalCount = count[3]
+  count = _HEADER(view)
+  _message = DNSMessage(DNSMessageHeader(*count), view)
 
-  _offset = 0
-  for i in range(count[0]):
-    _q = mdns.get_query(_message.data, _offset)
+  # offset -> labels, shared by every name decoded from this message
+  table = {}
+  _offset = DNSMessageHeader.ABS_DNSM_H_LEN
+  for i in range(count[2]):
+    _q = mdns.get_query(view, _offset, table)
     _offset += _q.size
     _message.questions.append(_q)
   
-  for i, l in enumerate([_message.answers, _message.authorities, _message.additionalRR], start=1):
-    for c in range(count[i]):
-      _x = mdns.get_resource(_message.data, _offset)
-      _offset += _x.size
-      l.append(_x)
-  
+  an, _offset = _scan_section(view, _offset, count[3])
+  au, _offset = _scan_section(view, _offset, count[4])
+  ad, _offset = _scan_section(view, _offset, count[5])
+  _message.answers = LazySection(view, an, table)
+  _message.authorities = LazySection(view, au, table)
+  _message.additionalRR = LazySection(view, ad, table)
   return _message
 
+# Result of peek(). name/type belong to the first question, or to the
+# first answer if the message has no questions (None/-1 if neither).
+Peek = namedtuple('Peek', ['id', 'flags', 'is_response', 'questionCount', 'answerCount',
+                           'authorityCount', 'additionalCount', 'name', 'type'])
+
+def _peek_name(data, index) -> tuple:
+  labels = []
+  end = -1
+  while True:
+    _c0 = data[index]
+    if _c0 == 0x00:
+      return ('.'.join(labels), end if end >= 0 else index + 1)
+
+    if _c0 & 0xc0 == 0xc0:
+      n_off = ((_c0 & 0x3F) << 8) | data[index + 1]
+      if n_off >= index:
+        raise IndexError('Compression pointer must point backwards')
+      if end < 0:
+        end = index + 2
+      index = n_off
+    elif _c0 & 0xc0:
+      raise IndexError('Illegal label length 0x%X in domain name' % _c0)
+    else:
+      labels.append(str(data[index+1:index+1+_c0], 'utf-8', 'replace'))
+      index += _c0 + 1
+
+# Reads the header and the name/type of the first record straight from
+# the buffer without building any objects - cheap enough to decide
+# whether a datagram should be decoded at all. Returns None if the
+# datagram is too short to contain a header.
+def peek(data) -> Peek:
+  if len(data) < DNSMessageHeader.ABS_DNSM_H_LEN:
+    return None
+
+  count = _HEADER(data)
+  name = None
+  rrtype = -1
+  if count[2] or count[3]:
+    try:
+      name, index = _peek_name(data, DNSMessageHeader.ABS_DNSM_H_LEN)
+      rrtype = _RDLENGTH(data, index)[0]
+    except (IndexError, struct.error):
+      name = None
+
+  return Peek(count[0], count[1], (count[1] & mdns.types.FLAG_QR) != 0,
+              count[2], count[3], count[4], count[5], name, rrtype)
+
+# A predicate over Peek results. Every given criterion has to match:
+#   qr     - 'query' or 'response'
+#   qtype  - record type of the peeked name
+#   suffix - name suffix, e.g. '_airplay._tcp.local' (case-insensitive)
+class PeekFilter:
+  def __init__(self, qr=None, qtype=None, suffix=None) -> None:
+    if qr not in (None, 'query', 'response'):
+      raise ValueError("Invalid qr - expected one of {}".format(('query', 'response')))
+
+    self.qr = qr
+    self.qtype = qtype
+    self.suffix = suffix.strip('.').lower() if suffix else None
+
+  def __call__(self, info) -> bool:
+    if info is None:
+      return False
+    if self.qr is not None and info.is_response != (self.qr == 'response'):
+      return False
+    if self.qtype is not None and info.type != self.qtype:
+      return False
+    if self.suffix is not None:
+      if info.name is None:
+        return False
+      name = info.name.lower()
+      if name != self.suffix and not name.endswith('.' + self.suffix):
+        return False
+    return True
+
+  # peeks the raw datagram and applies this filter
+  def match(self, data) -> bool:
+    return self(peek(data))
+
 def buildq(dname, qType=mdns.types.DNS_QCLASS_ANY, qClass=mdns.types.DNS_CLASS_IN, qu=False):
   name = None
   if type(dname) == list:
@@ -74,23 +233,43 @@ def buildq(dname, qType=mdns.types.DNS_QCLASS_ANY, qClass=mdns.types.DNS_CLASS_I
     raise ValueError('Invalid Domain-Name type!')
   
   if qu:
-    qClass &= mdns.types.DNS_QCLASS_UR
+    qClass |= mdns.types.DNS_QCLASS_UR
   
   return mdns.Query(mdns.DomainName(name), qType, qClass)
 
-def buildm(id=0x0000, flags=0x0000, questions=None):
+# Builds a message. With a RecordCache the answer section is filled with
+# the known answers to the questions (RFC 6762 7.1), so responders do not
+# repeat records the querier still has.
+def buildm(id=0x0000, flags=0x0000, questions=None, answers=None, cache=None, now=None):
   if not questions:
     questions = []
+  answers = list(answers) if answers else []
+  if cache is not None:
+    answers += cache.known_answers(questions, now)
 
-  return DNSMessage(DNSMessageHeader(id, flags, len(questions)), None, questions) 
+  return DNSMessage(DNSMessageHeader(id, flags, len(questions), len(answers)), None, questions, answers)
 
-def to_bytes(obj, buf: bytearray) -> bytes:
+# Appends the wire format of obj to buf. The header counts of a message are
+# taken from its sections. Names of a message with records are compressed
+# against the names written before them (names is the compression table of
+# the message being built); messages with questions only are written as
+# they always were, without compression.
+def to_bytes(obj, buf: bytearray, names=None) -> bytes:
   o_type = type(obj)
 
   if o_type == DNSMessage:
-    to_bytes(obj.h, buf)
+    # offsets in the compression table are relative to the message start
+    msg = bytearray()
+    sections = (obj.answers, obj.authorities, obj.additionalRR)
+    names = {} if any(len(x) for x in sections) else None
+    to_bytes(DNSMessageHeader(obj.h.id, obj.h.flags, len(obj.questions),
+                              *[len(x) for x in sections]), msg)
     for _q in obj.questions:
-      to_bytes(_q, buf)
+      to_bytes(_q, msg, names)
+    for section in sections:
+      for record in section:
+        to_bytes(record, msg, names)
+    buf.extend(msg)
 
   elif o_type == DNSMessageHeader:
     for z in [obj.id, obj.flags, obj.questionCount,
@@ -100,25 +279,37 @@ def to_bytes(obj, buf: bytearray) -> bytes:
         buf.append(x)
 
   elif o_type == mdns.Query:
-    to_bytes(obj.qname, buf)
+    to_bytes(obj.qname, buf, names)
     for z in [obj.qtype, obj.qclass]:
       for x in __u16tou8(z):
         buf.append(x)
 
+  elif o_type == mdns.ResourceRecord:
+    to_bytes(obj.name, buf, names)
+    buf.extend(_RR_HEADER.pack(obj.type, obj.clazz, obj.ttl, 0))
+    start = len(buf)
+    mdns.std_rr.write_rdata(buf, obj.rdata, names)
+    struct.pack_into('!H', buf, start - 2, len(buf) - start)
+
   elif o_type == mdns.DomainName:
-    if obj.isRef:
+    if names is not None:
+      mdns.std_rr.write_name(buf, obj, names)
+    elif obj.isRef:
       buf.append(0xc0)
       buf.append(obj.ref_num)
     else:
+      # labels are decoded as UTF-8, so they are encoded the same way
       for x in obj.raw_name:
-        buf.append(len(x))
-        for y in x:
-          buf.append(ord(y))
+        label = x.encode('utf-8')
+        buf.append(len(label))
+        buf.extend(label)
       buf.append(0x00)
   
   else:
     raise TypeError('Unsupported Type')
 
+_RR_HEADER = struct.Struct('!HHIH')
+
 U8_MASK = 0xFF
 
 def __u16tou8(num) -> tuple:
@@ -0,0 +1,370 @@
+import mmap
+import socket
+import struct
+import time
+
+# link-layer header types (www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+MDNS_PORT = 5353
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+
+IPPROTO_UDP = 17
+# IPv6 extension headers that can be skipped on the way to UDP
+IPV6_EXT_HEADERS = (0, 43, 60)
+
+_U16 = struct.Struct('!H').unpack_from
+_IPV4 = struct.Struct('!xxHxxHxB').unpack_from
+_UDP = struct.Struct('!HHH').unpack_from
+
+####################################################
+# Network-Layers
+####################################################
+def _ip_payload(frame, linktype) -> int:
+  # returns the offset of the IP header within the frame or -1
+  if linktype == LINKTYPE_ETHERNET:
+    index = 12
+    ethertype = _U16(frame, index)[0]
+    while ethertype in ETHERTYPE_VLAN:
+      index += 4
+      ethertype = _U16(frame, index)[0]
+    return index + 2 if ethertype in (ETHERTYPE_IPV4, ETHERTYPE_IPV6) else -1
+
+  if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, 12, 14):
+    return 0
+
+  if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+    # the address family is stored in the byte order of the capturing host
+    return 4
+
+  if linktype == LINKTYPE_LINUX_SLL:
+    return 16 if _U16(frame, 14)[0] in (ETHERTYPE_IPV4, ETHERTYPE_IPV6) else -1
+
+  if linktype == LINKTYPE_LINUX_SLL2:
+    return 20 if _U16(frame, 0)[0] in (ETHERTYPE_IPV4, ETHERTYPE_IPV6) else -1
+  return -1
+
+# Extracts the UDP payload sent from or to the given port. Returns a tuple
+# (source address, payload) or None if the frame does not carry such a
+# datagram (fragments are skipped). The payload is a slice of frame.
+def udp_payload(frame, linktype, port=MDNS_PORT) -> tuple:
+  try:
+    index = _ip_payload(frame, linktype)
+    if index < 0:
+      return None
+
+    version = frame[index] >> 4
+    if version == 4:
+      ihl = (frame[index] & 0x0F) * 4
+      total, frag, proto = _IPV4(frame, index)
+      if proto != IPPROTO_UDP or frag & 0x3FFF:
+        return None
+      src = socket.inet_ntoa(frame[index+12:index+16])
+      end = index + total
+      index += ihl
+
+    elif version == 6:
+      proto = frame[index+6]
+      end = index + 40 + _U16(frame, index+4)[0]
+      src = socket.inet_ntop(socket.AF_INET6, frame[index+8:index+24])
+      index += 40
+      while proto in IPV6_EXT_HEADERS:
+        proto = frame[index]
+        index += (frame[index+1] + 1) * 8
+      if proto != IPPROTO_UDP:
+        return None
+    else:
+      return None
+
+    sport, dport, length = _UDP(frame, index)
+    if port not in (sport, dport):
+      return None
+
+    end = min(end, index + length, len(frame))
+    return (src, frame[index+8:end])
+  except (IndexError, struct.error, ValueError):
+    return None
+
+####################################################
+# Capture-Files
+####################################################
+# Streams (timestamp, source, payload) tuples of all UDP datagrams on the
+# mDNS port from a pcap or pcapng file. The file is memory-mapped and the
+# payloads are memoryview slices of the mapping, so nothing is read into
+# memory before it is used. The payloads are valid until close().
+class PcapReader:
+  def __init__(self, path, port=MDNS_PORT) -> None:
+    self.path = path
+    self.port = port
+    self.is_ng = False
+    self.linktype = -1
+    self._mmap = None
+    self.view = memoryview(b'')
+    self._file = open(path, 'rb')
+    try:
+      self._open()
+    except Exception:
+      # the file and the mapping are not used for invalid files
+      self.close()
+      raise
+
+  def _open(self):
+    try:
+      self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+      self.view = memoryview(self._mmap)
+    except ValueError:
+      # empty file
+      pass
+
+    if len(self.view) < 24:
+      raise ValueError('Not a pcap/pcapng file: %s' % (self.path))
+
+    magic = struct.unpack_from('<I', self.view)[0]
+    if magic == PCAPNG_SHB:
+      self.is_ng = True
+    elif magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+      self._endian = '<'
+    elif magic in (_swap32(PCAP_MAGIC_US), _swap32(PCAP_MAGIC_NS)):
+      self._endian = '>'
+      magic = _swap32(magic)
+    else:
+      raise ValueError('Not a pcap/pcapng file: %s' % (self.path))
+
+    if not self.is_ng:
+      self._ts_scale = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+      self.linktype = struct.unpack_from(self._endian + 'I', self.view, 20)[0] & 0x0FFFFFFF
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __iter__(self):
+    if self.is_ng:
+      return self._iter_pcapng()
+    return self._iter_pcap(24, len(self.view))
+
+  # Splits the file at record boundaries into chunks of about chunk_size
+  # bytes. A chunk is a picklable (start, stop, state) tuple that can be
+  # read on its own with read_chunk(), e.g. by another process that opened
+  # the same file.
+  def split(self, chunk_size=32 << 20) -> list:
+    chunks = []
+    view = self.view
+    if not self.is_ng:
+      header = struct.Struct(self._endian + 'IIII').unpack_from
+      start = index = 24
+      while index + 16 <= len(view):
+        index += 16 + header(view, index)[2]
+        if index - start >= chunk_size:
+          chunks.append((start, index, None))
+          start = index
+      if index > start:
+        chunks.append((start, min(index, len(view)), None))
+      return chunks
+
+    # pcapng: remember byte order and interfaces at every chunk start
+    endian = '<'
+    interfaces = []
+    start = index = 0
+    state = (endian, [])
+    while index + 12 <= len(view):
+      if struct.unpack_from('<I', view, index)[0] == PCAPNG_SHB:
+        endian = '<' if struct.unpack_from('<I', view, index+8)[0] == PCAPNG_BYTE_ORDER else '>'
+        interfaces = []
+      b_type, b_len = struct.unpack_from(endian + 'II', view, index)
+      if b_len < 12:
+        break
+      if b_type == 1:
+        interfaces.append((struct.unpack_from(endian + 'H', view, index+8)[0],
+                           _if_tsresol(view, index + 16, index + b_len - 4, endian)))
+      index += b_len
+      if index - start >= chunk_size:
+        chunks.append((start, index, state))
+        start = index
+        state = (endian, list(interfaces))
+    if index > start:
+      chunks.append((start, min(index, len(view)), state))
+    return chunks
+
+  def read_chunk(self, chunk):
+    start, stop, state = chunk
+    if not self.is_ng:
+      return self._iter_pcap(start, stop)
+    return self._iter_pcapng(start, stop, state[0], list(state[1]))
+
+  def close(self):
+    try:
+      self.view.release()
+      if self._mmap is not None:
+        self._mmap.close()
+    except BufferError:
+      # payloads are still referenced, the mapping goes away with them
+      pass
+    self._file.close()
+
+  def _iter_pcap(self, start, stop):
+    view = self.view
+    header = struct.Struct(self._endian + 'IIII').unpack_from
+    index = start
+    while index + 16 <= stop:
+      ts_sec, ts_frac, incl_len, orig_len = header(view, index)
+      index += 16
+      if index + incl_len > len(view):
+        break
+
+      r = udp_payload(view[index:index+incl_len], self.linktype, self.port)
+      index += incl_len
+      if r is not None:
+        yield (ts_sec + ts_frac * self._ts_scale, r[0], r[1])
+
+  def _iter_pcapng(self, start=0, stop=None, endian='<', interfaces=None):
+    view = self.view
+    stop = len(view) if stop is None else stop
+    interfaces = [] if interfaces is None else interfaces
+    index = start
+    while index + 12 <= stop:
+      if struct.unpack_from('<I', view, index)[0] == PCAPNG_SHB:
+        # new section: byte order and interfaces start over
+        endian = '<' if struct.unpack_from('<I', view, index+8)[0] == PCAPNG_BYTE_ORDER else '>'
+        interfaces = []
+
+      b_type, b_len = struct.unpack_from(endian + 'II', view, index)
+      if b_len < 12 or index + b_len > len(view):
+        break
+      body = index + 8
+      end = index + b_len - 4
+
+      if b_type == 1:
+        # Interface Description Block: (linktype, timestamp resolution)
+        interfaces.append((struct.unpack_from(endian + 'H', view, body)[0],
+                           _if_tsresol(view, body + 8, end, endian)))
+
+      elif b_type in (6, 2):
+        # Enhanced Packet Block / obsolete Packet Block
+        if b_type == 6:
+          if_id, ts_high, ts_low, cap_len = struct.unpack_from(endian + 'IIII', view, body)
+        else:
+          if_id, ts_high, ts_low, cap_len = struct.unpack_from(endian + 'HxxIII', view, body)
+        data = body + 20
+        if if_id < len(interfaces):
+          linktype, scale = interfaces[if_id]
+          r = udp_payload(view[data:min(data + cap_len, end)], linktype, self.port)
+          if r is not None:
+            yield (((ts_high << 32) | ts_low) * scale, r[0], r[1])
+
+      elif b_type == 3:
+        # Simple Packet Block: no timestamp, always interface 0
+        if interfaces:
+          r = udp_payload(view[body+4:end], interfaces[0][0], self.port)
+          if r is not None:
+            yield (0.0, r[0], r[1])
+
+      index += b_len
+
+# Writes datagrams in libpcap format (microsecond timestamps, little
+# endian). With LINKTYPE_RAW - the default - write() synthesizes the IPv4 or
+# IPv6 and UDP headers from the sender address, so received payloads can be
+# stored as they are. Records go through a large write buffer and are never
+# flushed individually; call flush() or close() to get them on disk.
+class PcapWriter:
+  def __init__(self, path, linktype=LINKTYPE_RAW, snaplen=65535, buffering=1 << 20) -> None:
+    self.path = path
+    self.linktype = linktype
+    self.count = 0
+    self._file = open(path, 'wb', buffering=buffering)
+    self._file.write(struct.pack('<IHHiIII', PCAP_MAGIC_US, 2, 4, 0, 0, snaplen, linktype))
+    # offset of the next record
+    self.offset = 24
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __str__(self) -> str:
+    return '<PcapWriter path=%s linktype=%d count=%d size=%d |>' % (
+      self.path, self.linktype, self.count, self.offset
+    )
+
+  # Stores a UDP payload received from address ((host, port[, ...]) or None)
+  # at timestamp (default: now). Returns the file offset of the record.
+  def write(self, data, address=None, timestamp=None, port=MDNS_PORT) -> int:
+    if self.linktype != LINKTYPE_RAW:
+      raise ValueError('Headers can only be synthesized for LINKTYPE_RAW')
+
+    host, sport = (address[0], address[1]) if address else ('0.0.0.0', port)
+    udp = _UDP_HEADER(sport, port, 8 + len(data), 0)
+    if ':' in host:
+      ip = _IPV6_HEADER(0x60000000, len(udp) + len(data), IPPROTO_UDP, 255,
+                        socket.inet_pton(socket.AF_INET6, host.split('%')[0]), _MDNS_IPV6)
+    else:
+      ip = _ipv4_header(socket.inet_aton(host), 28 + len(data))
+    return self.write_frame(b''.join((ip, udp, data)), timestamp)
+
+  # Stores a complete frame of the writer's link type.
+  def write_frame(self, frame, timestamp=None) -> int:
+    if timestamp is None:
+      timestamp = time.time()
+    sec = int(timestamp)
+    offset = self.offset
+    self._file.write(_RECORD_HEADER(sec, int((timestamp - sec) * 1e6), len(frame), len(frame)))
+    self._file.write(frame)
+    self.offset += 16 + len(frame)
+    self.count += 1
+    return offset
+
+  def flush(self):
+    self._file.flush()
+
+  def close(self):
+    self._file.close()
+
+_UDP_HEADER = struct.Struct('!HHHH').pack
+_IPV6_HEADER = struct.Struct('!IHBB16s16s').pack
+_RECORD_HEADER = struct.Struct('<IIII').pack
+_MDNS_IPV4 = bytes((224, 0, 0, 251))
+_MDNS_IPV6 = bytes.fromhex('ff0200000000000000000000000000fb')
+
+def _ipv4_header(src, total) -> bytes:
+  header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, total, 0, 0, 255, IPPROTO_UDP, 0, src, _MDNS_IPV4)
+  checksum = sum(struct.unpack('!10H', header))
+  checksum = (checksum & 0xFFFF) + (checksum >> 16)
+  checksum = (checksum & 0xFFFF) + (checksum >> 16)
+  return header[:10] + struct.pack('!H', ~checksum & 0xFFFF) + header[12:]
+
+def _swap32(x) -> int:
+  return struct.unpack('<I', struct.pack('>I', x))[0]
+
+def _if_tsresol(view, index, end, endian) -> float:
+  # walks the IDB options for if_tsresol (code 9), default is microseconds
+  while index + 4 <= end:
+    code, length = struct.unpack_from(endian + 'HH', view, index)
+    if code == 0:
+      break
+    if code == 9 and length >= 1:
+      v = view[index + 4]
+      return 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+    index += 4 + ((length + 3) & ~3)
+  return 1e-6
+
+def read_pcap(path, port=MDNS_PORT):
+  with PcapReader(path, port) as reader:
+    yield from reader
@@ -0,0 +1,72 @@
+# A ring of preallocated receive buffers. receive() waits until the socket
+# is readable and then drains every ready datagram (at most one per slot)
+# without blocking, so a burst costs one wakeup and no allocations.
+#
+# The returned memoryviews point into the ring: a batch stays valid until
+# the next call of receive(). Use bytes() on a datagram - or on anything
+# decoded from it that has to live longer - to keep a copy.
+class RecvRing:
+  def __init__(self, slots=64, slot_size=9000) -> None:
+    self.buffers = [bytearray(slot_size) for i in range(slots)]
+    self.views = [memoryview(b) for b in self.buffers]
+    self.received = 0
+    self.truncated = 0
+    self.wakeups = 0
+
+  def __len__(self) -> int:
+    return len(self.views)
+
+  def __str__(self) -> str:
+    return '<RecvRing slots=%d received=%d truncated=%d wakeups=%d |>' % (
+      len(self.views), self.received, self.truncated, self.wakeups
+    )
+
+  # Reads ready datagrams until the socket would block or every slot is
+  # used. Returns a list of (memoryview, address). The socket's blocking
+  # mode and timeout are left as they are: reads on a blocking socket use
+  # MSG_DONTWAIT where available, otherwise the socket is non-blocking
+  # only while it is drained.
+  def drain(self, sock) -> list:
+    import socket
+
+    timeout = sock.gettimeout()
+    flags = getattr(socket, 'MSG_DONTWAIT', 0) if timeout is None else 0
+    restore = timeout != 0 and flags == 0
+    if restore:
+      sock.settimeout(0)
+    try:
+      batch = self._drain(sock, flags, getattr(socket, 'MSG_TRUNC', 0))
+    finally:
+      if restore:
+        sock.settimeout(timeout)
+
+    self.received += len(batch)
+    return batch
+
+  def _drain(self, sock, flags, msg_trunc) -> list:
+    batch = []
+    use_msg = hasattr(sock, 'recvmsg_into')
+    for view in self.views:
+      try:
+        if use_msg:
+          nbytes, _, msg_flags, addr = sock.recvmsg_into([view], 0, flags)
+          if msg_flags & msg_trunc:
+            self.truncated += 1
+        else:
+          nbytes, addr = sock.recvfrom_into(view, 0, flags)
+      except (BlockingIOError, InterruptedError):
+        break
+      batch.append((view[:nbytes], addr))
+    return batch
+
+  # Waits up to timeout seconds (None: forever) for the socket to become
+  # readable and drains it.
+  def receive(self, sock, timeout=None) -> list:
+    import select
+
+    ready, _, _ = select.select([sock], [], [], timeout)
+    if not ready:
+      return []
+
+    self.wakeups += 1
+    return self.drain(sock)
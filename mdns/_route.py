@@ -0,0 +1,137 @@
+import mdns
+import threading
+
+from functools import lru_cache
+
+SECTIONS = ('questions', 'answers', 'authorities', 'additionalRR')
+
+class Subscription:
+  __slots__ = ('func', 'rrtype', 'section', 'qr', 'suffix', 'order')
+
+  def __init__(self, func, rrtype=None, section=None, qr=None, suffix=None, order=0) -> None:
+    if section is not None and section not in SECTIONS:
+      raise ValueError("Invalid section - expected one of {}".format(SECTIONS))
+    if qr not in (None, 'query', 'response'):
+      raise ValueError("Invalid qr - expected one of {}".format(('query', 'response')))
+
+    self.func = func
+    self.rrtype = rrtype
+    self.section = section
+    self.qr = qr
+    self.suffix = _labels(suffix.strip('.').split('.')) if suffix else ()
+    self.order = order
+
+  def __str__(self) -> str:
+    return '<Subscription func=%s rrtype=%s section=%s qr=%s suffix=%s |>' % (
+      getattr(self.func, '__name__', self.func), self.rrtype, self.section,
+      self.qr, '.'.join(self.suffix)
+    )
+
+  # True if the subscription is only restricted on message level
+  def is_global(self) -> bool:
+    return self.rrtype is None and not self.suffix
+
+# decoded names are interned tuples, so the lowered form is cached
+@lru_cache(maxsize=4096)
+def _lower(raw_name) -> tuple:
+  return tuple(x.lower() for x in raw_name)
+
+def _labels(raw_name) -> tuple:
+  return _lower(tuple(raw_name))
+
+# Routes decoded messages to the subscribed handlers. Record-level
+# subscriptions are indexed by record type and name suffix, so every
+# record costs a few dict lookups (one per suffix of its name) instead of
+# a call to every handler.
+class HandlerIndex:
+  def __init__(self) -> None:
+    self.subscriptions = []
+    # subscriptions without rrtype and suffix
+    self._global = []
+    # rrtype (None: any) -> suffix tuple -> [Subscription]
+    self._index = {}
+    # sections that have to be walked for the indexed subscriptions
+    self._sections = ()
+    self._counter = 0
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self.subscriptions)
+
+  def subscribe(self, func, rrtype=None, section=None, qr=None, suffix=None) -> Subscription:
+    with self._lock:
+      sub = Subscription(func, rrtype, section, qr, suffix, self._counter)
+      self._counter += 1
+      self.subscriptions.append(sub)
+      self._rebuild()
+      return sub
+
+  def unsubscribe(self, func):
+    with self._lock:
+      self.subscriptions = [x for x in self.subscriptions if x.func != func]
+      self._rebuild()
+
+  def _rebuild(self):
+    _global = []
+    _index = {}
+    sections = set()
+    for sub in self.subscriptions:
+      if sub.is_global():
+        _global.append(sub)
+        continue
+
+      _index.setdefault(sub.rrtype, {}).setdefault(sub.suffix, []).append(sub)
+      sections.update(SECTIONS if sub.section is None else (sub.section,))
+
+    # swapped in as a whole, so route() never sees a partial index
+    self._global, self._index = _global, _index
+    self._sections = tuple(x for x in SECTIONS if x in sections)
+
+  # Returns the handlers for the given message, each at most once and in
+  # the order of their earliest matching subscription.
+  def route(self, packet) -> list:
+    is_response = (packet.h.flags & mdns.types.FLAG_QR) != 0
+    # handler -> order of the matching subscription
+    matched = {}
+
+    for sub in self._global:
+      if sub.order >= matched.get(sub.func, sub.order + 1):
+        continue
+      if sub.qr is not None and is_response != (sub.qr == 'response'):
+        continue
+      if sub.section is not None and len(getattr(packet, sub.section)) == 0:
+        continue
+      matched[sub.func] = sub.order
+
+    _index = self._index
+    for section in self._sections:
+      for rrtype, raw_name in _owners(getattr(packet, section)):
+        labels = _labels(raw_name)
+        for key in (rrtype, None):
+          by_suffix = _index.get(key)
+          if by_suffix is None:
+            continue
+
+          for i in range(len(labels) + 1):
+            subs = by_suffix.get(labels[i:])
+            if subs is None:
+              continue
+            for sub in subs:
+              if sub.order >= matched.get(sub.func, sub.order + 1):
+                continue
+              if sub.section is not None and sub.section != section:
+                continue
+              if sub.qr is not None and is_response != (sub.qr == 'response'):
+                continue
+              matched[sub.func] = sub.order
+
+    return sorted(matched, key=matched.get)
+
+# Yields (type, raw_name) of the records in a section. Only the owner names
+# of lazily decoded sections are read, the rdata is left to the handlers.
+def _owners(section):
+  if type(section) == mdns.LazySection:
+    return section.owners()
+  return ((x.qtype, x.qname.raw_name) if type(x) == mdns.Query
+          else (x.type, x.name.raw_name if type(x.name) == mdns.DomainName else ())
+          for x in section)
@@ -1,9 +1,14 @@
 import mdns
+import struct
+
+from ._intern import NAME_POOL
 
 class RRException(Exception):
   pass
 
 class Query:
+  __slots__ = ('qname', 'qtype', 'qclass', 'size')
+
   def __init__(self, name=None, qtype=0, qclass=0) -> None:
     self.qname = [] if not name else name
     self.qtype = qtype
@@ -12,13 +17,14 @@ class Query:
   
   def __str__(self) -> str:
     s = "<Query "
-    for k in vars(self):
+    for k in self.__slots__:
       s += '%s=%s ' % (k, getattr(self, k))
     return s + '|>'
 
 class ResourceRecord:
+  __slots__ = ('ttl', 'rdlength', 'rdata', 'name', 'type', 'clazz', 'size')
+
   def __init__(self) -> None:
-    super().__init__()
     self.ttl = 0
     self.rdlength = 0
     self.rdata = None
@@ -27,19 +33,18 @@ class ResourceRecord:
     self.clazz = 0
     self.size = 0
   
-    def __str__(self) -> str:
-      s = "<ResourceRecord "
-      for k in vars(self):
-        if k == 'rdata':
-          s += getattr(self, k).__str__()
-        else:
-          s += '%s=%s ' % (k, getattr(self, k))
-      return s + '|>'
+  def __str__(self) -> str:
+    s = "<ResourceRecord "
+    for k in self.__slots__:
+      s += '%s=%s ' % (k, getattr(self, k))
+    return s + '|>'
 
   def has_cache_flush(self):
     return (self.clazz & 32768) != 0
 
 class DomainName:
+  __slots__ = ('isRef', 'ref_num', 'raw_name')
+
   def __init__(self, name=None, ref_num=-1, isRef=False) -> None:
     self.isRef = isRef
     self.ref_num = ref_num
@@ -48,6 +53,16 @@ class DomainName:
   def __str__(self) -> str:
     return '.'.join(self.raw_name)
 
+  # decoded names carry interned label tuples, so equal names are
+  # usually the very same object
+  def __eq__(self, other) -> bool:
+    if type(other) != DomainName:
+      return NotImplemented
+    return self.raw_name is other.raw_name or tuple(self.raw_name) == tuple(other.raw_name)
+
+  def __hash__(self) -> int:
+    return hash(tuple(self.raw_name))
+
 def get_txt(data, offset) -> tuple:
   if data[offset] == 0xc0:
     return (offset + 2, [data[offset + 1]])
@@ -74,27 +89,41 @@ def get_txt(data, offset) -> tuple:
 
   return (index + 1, name)
 
-def get_qname(all_data, offset) -> tuple:
+# The table maps the absolute offset of every label that has been decoded
+# in a message to the label tuple of the name starting there. All names of
+# one message share the table, so each pointer target is decoded only once
+# and following a pointer is a single lookup.
+def get_qname(all_data, offset, table=None) -> tuple:
+  if table is None:
+    table = {}
+
   index = offset
   name = DomainName()
+  labels = []
+  starts = []
+  tail = ()
   while True:
-    _c0 = mdns.u8(all_data, index)
+    _c0 = all_data[index]
     if _c0 == 0x00:
       break
     
     tmp = _c0 & 0xc0
     if tmp == 0xc0:
-      n_off = ((_c0 & 0x3F) << 8) | mdns.u8(all_data, index + 1) - mdns.DNSMessageHeader.ABS_DNSM_H_LEN
+      # offsets are absolute within the datagram
+      n_off = ((_c0 & 0x3F) << 8) | all_data[index + 1]
+      if n_off >= index:
+        raise IndexError('Compression pointer must point backwards')
       index += 1
         
-      if n_off < len(all_data):
-        if mdns.u8(all_data, n_off) & 0xc0 != 0:
-          print("[!] Compression pointer must point to real label")
-          break
+      if all_data[n_off] & 0xc0 != 0:
+        print("[!] Compression pointer must point to real label")
+        break
         
-        name.isRef = True
-        name.ref_num = n_off
-        name.raw_name += get_qname(all_data, n_off)[1].raw_name
+      name.isRef = True
+      name.ref_num = n_off
+      tail = table.get(n_off)
+      if tail is None:
+        tail = get_qname(all_data, n_off, table)[1].raw_name
       break 
 
     elif tmp == 0x40:
@@ -107,59 +136,60 @@ def get_qname(all_data, offset) -> tuple:
       length = _c0
       index += 1
       try:
-        name.raw_name.append(str(all_data[index:index+length], 'utf-8'))
+        labels.append(NAME_POOL.intern(str(all_data[index:index+length], 'utf-8')))
+        starts.append(index - 1)
       except:
         pass
       index += length
   
+  # raw_name of a decoded name is an interned tuple of interned labels
+  name.raw_name = NAME_POOL.intern(tuple(labels) + tail if labels else tail)
+  for i, x in enumerate(starts):
+    table[x] = name.raw_name[i:]
   return (index + 1, name)
 
-def get_query(data, offset) -> Query:
-  index, name = get_qname(data, offset)
-  if index > len(data):
+_QUERY_FIELDS = struct.Struct('!HH').unpack_from
+_RR_FIELDS = struct.Struct('!HHIH').unpack_from
+
+def get_query(data, offset, table=None) -> Query:
+  index, name = get_qname(data, offset, table)
+  if index + 4 > len(data):
     raise RRException() from IndexError
   
   rr_q = Query()
   rr_q.qname = name
 
-  rr_q.qtype = mdns.u16(data, index)
-  index += 2
+  rr_q.qtype, rr_q.qclass = _QUERY_FIELDS(data, index)
+  index += 4
   if rr_q.qtype not in mdns.DNS_TypeValues:
     raise RRException('Not a default Query-Type') from ValueError
 
-  rr_q.qclass = mdns.u16(data, index)
-  index += 2
   if (rr_q.qclass & mdns.types.DNS_QCLASS_ANY) == 0:
     raise RRException('Not a default Query-Class')
 
   rr_q.size = index - offset
   return rr_q
 
-def get_resource(data, offset) -> ResourceRecord:
+def get_resource(data, offset, table=None) -> ResourceRecord:
   if data[offset] == 0x00:
     # meta-RR (OPT)
     return mdns.DNS_TypeValues[41][2](data, offset, -1)
 
-  index, name = get_qname(data, offset)
-  if len(data) < index:
-    raise IndexError()
+  index, name = get_qname(data, offset, table)
+  if len(data) < index + 10:
+    raise IndexError('Truncated resource record')
   
   record = ResourceRecord()
   record.name = name
 
-  record.type = mdns.u16(data, index)
-  index+=2
-  record.clazz = mdns.u16(data, index)
-  index+=2
-
-  record.ttl = mdns.u32(data, index)
-  index+=4
-  record.rdlength = mdns.u16(data, index)
-  index+=2
+  record.type, record.clazz, record.ttl, record.rdlength = _RR_FIELDS(data, index)
+  index += 10
+  if len(data) < index + record.rdlength:
+    raise IndexError('Truncated resource data')
 
   if record.type in mdns.DNS_TypeValues:
     r_type = mdns.DNS_TypeValues[record.type]
-    record.rdata = r_type[2](data, index, record.rdlength)
+    record.rdata = r_type[2](data, index, record.rdlength, table)
   
   record.size = (index+record.rdlength) - offset
   return record
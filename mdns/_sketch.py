@@ -0,0 +1,101 @@
+import hashlib
+import math
+
+from array import array
+
+# Fixed-memory frequency estimator (count-min sketch). An estimate is never
+# below the true count and exceeds it by at most eps * total with
+# probability 1 - delta. The sketch uses ceil(e / eps) * ceil(ln(1 / delta))
+# counters, independent of the number of distinct keys.
+#
+# Keys are hashed with blake2b (not hash(), which differs between
+# processes), so sketches with the same parameters can be merged across
+# files and worker processes.
+#
+# The k keys with the highest estimates are remembered as candidates for
+# top(); the sketch itself cannot enumerate keys.
+class CountMinSketch:
+  def __init__(self, eps=0.001, delta=0.01, k=32, seed=0) -> None:
+    if not (0 < eps < 1 and 0 < delta < 1):
+      raise ValueError('eps and delta must be in (0, 1)')
+
+    self.eps = eps
+    self.delta = delta
+    self.k = k
+    self.seed = seed
+    self.width = int(math.ceil(math.e / eps))
+    self.depth = int(math.ceil(math.log(1 / delta)))
+    self.total = 0
+    self.table = array('Q', bytes(8 * self.width * self.depth))
+    # key -> estimate (at the time of the last update)
+    self.candidates = {}
+    self._salt = seed.to_bytes(8, 'little')
+
+  def __len__(self) -> int:
+    return self.total
+
+  def __str__(self) -> str:
+    return '<CountMinSketch eps=%s delta=%s width=%d depth=%d total=%d |>' % (
+      self.eps, self.delta, self.width, self.depth, self.total
+    )
+
+  def _indexes(self, key) -> list:
+    if type(key) == str:
+      key = key.encode('utf-8')
+    digest = hashlib.blake2b(key, digest_size=16, salt=self._salt).digest()
+    # double hashing: row i uses h1 + i * h2
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    w = self.width
+    return [i * w + (h1 + i * h2) % w for i in range(self.depth)]
+
+  def add(self, key, count=1) -> int:
+    table = self.table
+    estimate = None
+    for index in self._indexes(key):
+      table[index] += count
+      if estimate is None or table[index] < estimate:
+        estimate = table[index]
+    self.total += count
+    self._candidate(key, estimate)
+    return estimate
+
+  def estimate(self, key) -> int:
+    table = self.table
+    return min(table[index] for index in self._indexes(key))
+
+  def __getitem__(self, key) -> int:
+    return self.estimate(key)
+
+  def _candidate(self, key, estimate):
+    candidates = self.candidates
+    if key in candidates or len(candidates) < self.k:
+      candidates[key] = estimate
+      return
+
+    low = min(candidates, key=candidates.get)
+    if estimate > candidates[low]:
+      del candidates[low]
+      candidates[key] = estimate
+
+  # Returns the n keys with the highest estimates as (key, estimate).
+  def top(self, n=10) -> list:
+    items = [(key, self.estimate(key)) for key in self.candidates]
+    items.sort(key=lambda x: x[1], reverse=True)
+    return items[:n]
+
+  # Adds the counts of another sketch with the same parameters.
+  def merge(self, other):
+    if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+      raise ValueError('Sketches with different parameters can not be merged')
+
+    table = self.table
+    for i, x in enumerate(other.table):
+      if x:
+        table[i] += x
+    self.total += other.total
+
+    estimates = {key: self.estimate(key) for key in set(self.candidates) | set(other.candidates)}
+    ranked = sorted(estimates, key=estimates.get, reverse=True)[:self.k]
+    self.candidates = {key: estimates[key] for key in ranked}
+    return self
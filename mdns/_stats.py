@@ -0,0 +1,100 @@
+import heapq
+import struct
+
+_COUNTS = struct.Struct('!4xHHHH').unpack_from
+
+# Per-source traffic counters (packets, bytes, records). Without k every
+# source is counted exactly. With k at most k sources are tracked using the
+# Space-Saving algorithm: a new source replaces the one with the fewest
+# packets and inherits its count as error, so every source with more than
+# packets/k packets is guaranteed to be in the table and its packet count
+# is overestimated by at most its error. Bytes and records of a replacing
+# source start from zero.
+#
+# Every update is O(1): tracked sources are grouped in buckets by packet
+# count and the smallest non-empty bucket is kept up to date.
+class SourceStats:
+  def __init__(self, k=None) -> None:
+    if k is not None and k < 1:
+      raise ValueError('k must be at least 1')
+
+    self.k = k
+    self.packets = 0
+    self.bytes = 0
+    self.records = 0
+    # source -> [packets, bytes, records, error]
+    self._entries = {}
+    # packet count -> {source: None} (insertion ordered)
+    self._buckets = {}
+    self._min = 0
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def __contains__(self, source) -> bool:
+    return source in self._entries
+
+  def __str__(self) -> str:
+    return '<SourceStats k=%s sources=%d packets=%d bytes=%d records=%d |>' % (
+      self.k, len(self._entries), self.packets, self.bytes, self.records
+    )
+
+  def add(self, source, nbytes=0, records=0):
+    self.packets += 1
+    self.bytes += nbytes
+    self.records += records
+
+    entry = self._entries.get(source)
+    if entry is None:
+      if self.k is not None and len(self._entries) >= self.k:
+        # replace a source with the minimum count
+        bucket = self._buckets[self._min]
+        victim = next(iter(bucket))
+        self._remove(victim, self._min)
+        del self._entries[victim]
+        entry = [self._min, 0, 0, self._min]
+      else:
+        entry = [0, 0, 0, 0]
+      self._entries[source] = entry
+    else:
+      self._remove(source, entry[0])
+
+    entry[0] += 1
+    entry[1] += nbytes
+    entry[2] += records
+    self._buckets.setdefault(entry[0], {})[source] = None
+    # counts only grow by one: the minimum is either a new source or moves
+    # on to the next bucket, which holds the source just incremented
+    if entry[0] == 1:
+      self._min = 1
+    elif self._min not in self._buckets:
+      self._min += 1
+
+  # Counts a raw mDNS datagram; the number of records is taken from the
+  # header counts.
+  def add_datagram(self, source, data):
+    records = sum(_COUNTS(data)) if len(data) >= 12 else 0
+    self.add(source, len(data), records)
+
+  def _remove(self, source, count):
+    bucket = self._buckets[count]
+    del bucket[source]
+    if not bucket:
+      del self._buckets[count]
+
+  # Returns (packets, bytes, records, error) of a tracked source or None.
+  def get(self, source) -> tuple:
+    entry = self._entries.get(source)
+    return tuple(entry) if entry is not None else None
+
+  # Returns the n sources with the most packets (all if n is None) as
+  # (source, packets, bytes, records, error) tuples.
+  def top(self, n=None) -> list:
+    items = ((k,) + tuple(v) for k, v in self._entries.items())
+    if n is None:
+      return sorted(items, key=lambda x: x[1], reverse=True)
+    return heapq.nlargest(n, items, key=lambda x: x[1])
+
+  # source -> packets
+  def as_dict(self) -> dict:
+    return {k: v[0] for k, v in self._entries.items()}
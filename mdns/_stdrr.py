@@ -1,25 +1,183 @@
 import mdns
 import math
+import struct
 
+_RR_FIELDS = struct.Struct('!HHIH').unpack_from
+_OPT_FIELDS = struct.Struct('!HH').unpack_from
+_AAAA_FIELDS = struct.Struct('!8H').unpack_from
+_SRV_FIELDS = struct.Struct('!HHH').unpack_from
+_SOA_FIELDS = struct.Struct('!IIIII').unpack_from
+
+# payloads are memoryview slices of the received datagram
+def _fmt(value):
+  return bytes(value) if type(value) == memoryview else value
+
+####################################################
+# RData-Classes
+####################################################
+# Every supported type has its own slotted class with fixed fields. The
+# fields of a class are the __slots__ of its whole hierarchy.
 class RData:
+  __slots__ = ()
+
+  def fields(self) -> tuple:
+    return tuple(k for c in reversed(type(self).__mro__) for k in getattr(c, '__slots__', ()))
+
   def __str__(self) -> str:
-    s = "<RData "
-    for k in vars(self):
-      s += '%s=%s ' % (k, getattr(self, k))
-    return s + '|>' 
+    s = "<%s " % (type(self).__name__)
+    for k in self.fields():
+      s += '%s=%s ' % (k, _fmt(getattr(self, k)))
+    return s + '|>'
+
+class RDataRaw(RData):
+  __slots__ = ('payload',)
+
+  def __init__(self, payload=None) -> None:
+    self.payload = payload
+
+class RDataTXT(RDataRaw):
+  __slots__ = ()
+
+  # the character-strings of the payload (copied)
+  @property
+  def strings(self) -> list:
+    result = []
+    index = 0
+    while index < len(self.payload):
+      _len = self.payload[index]
+      result.append(bytes(self.payload[index+1:index+1+_len]))
+      index += 1 + _len
+    return result
+
+class RDataA(RData):
+  __slots__ = ('addr',)
+
+  def __init__(self, addr=None) -> None:
+    self.addr = addr
+
+class RDataAAAA(RDataA):
+  __slots__ = ()
+
+class RDataDN(RData):
+  __slots__ = ('name',)
+
+  def __init__(self, name=None) -> None:
+    self.name = name
+
+class RDataNS(RDataDN):
+  __slots__ = ()
+
+class RDataCNAME(RDataDN):
+  __slots__ = ()
+
+class RDataPTR(RDataDN):
+  __slots__ = ()
+
+class RDataDNAME(RDataDN):
+  __slots__ = ()
+
+class RDataMINFO(RDataDN):
+  __slots__ = ('emailbx',)
+
+  def __init__(self, name=None, emailbx=None) -> None:
+    self.name = name
+    self.emailbx = emailbx
+
+class RDataRP(RDataDN):
+  __slots__ = ('other',)
+
+  def __init__(self, name=None, other=None) -> None:
+    self.name = name
+    self.other = other
+
+class RDataPX(RDataRP):
+  __slots__ = ('preference',)
+
+  def __init__(self, preference=0, name=None, other=None) -> None:
+    self.preference = preference
+    self.name = name
+    self.other = other
+
+class RDataMX(RData):
+  __slots__ = ('preference', 'target')
+
+  def __init__(self, preference=0, target=None) -> None:
+    self.preference = preference
+    self.target = target
+
+class RDataAFSDB(RDataMX):
+  __slots__ = ()
+
+class RDataRT(RDataMX):
+  __slots__ = ()
+
+class RDataKX(RDataMX):
+  __slots__ = ()
+
+class RDataSRV(RData):
+  __slots__ = ('priority', 'weight', 'port', 'target')
+
+  def __init__(self, priority=0, weight=0, port=0, target=None) -> None:
+    self.priority = priority
+    self.weight = weight
+    self.port = port
+    self.target = target
+
+class RDataSOA(RData):
+  __slots__ = ('mname', 'rname', 'serial', 'refresh', 'retry', 'expire', 'minimum')
+
+  def __init__(self, mname=None, rname=None, serial=0, refresh=0, retry=0, expire=0, minimum=0) -> None:
+    self.mname = mname
+    self.rname = rname
+    self.serial = serial
+    self.refresh = refresh
+    self.retry = retry
+    self.expire = expire
+    self.minimum = minimum
+
+class RDataHINFO(RData):
+  __slots__ = ('cpu', 'os')
+
+  def __init__(self, cpu=None, os=None) -> None:
+    self.cpu = cpu
+    self.os = os
+
+class RDataNSEC(RData):
+  __slots__ = ('next_dn', 'bitmap', 'bitmap_len', 'bmp_wblock', 'bitmap_types', 'bitmaps')
+
+  # bitmap, bitmap_len and bmp_wblock describe the first window, bitmaps
+  # holds the raw type bitmaps of all windows
+  def __init__(self, next_dn=None, bitmap=None, bitmap_len=0, bmp_wblock=0, bitmap_types=None, bitmaps=None) -> None:
+    self.next_dn = next_dn
+    self.bitmap = bitmap
+    self.bitmap_len = bitmap_len
+    self.bmp_wblock = bmp_wblock
+    self.bitmap_types = bitmap_types if bitmap_types else []
+    self.bitmaps = bitmaps
+
+class RDataOPT(RData):
+  __slots__ = ('options',)
+
+  def __init__(self, options=None) -> None:
+    self.options = options if options else []
 
 class OPT:
+  __slots__ = ('opcode', 'oplength', 'opdata')
+
   def __init__(self, code=0, length=0, data=None) -> None:
     self.opcode = code
     self.oplength = length
     self.opdata = data
-  
+
   def __str__(self) -> str:
     s = "<OPT "
-    for k in vars(self):
-      s += '%s=%s ' % (k, getattr(self, k))
-    return s + '|>' 
+    for k in self.__slots__:
+      s += '%s=%s ' % (k, _fmt(getattr(self, k)))
+    return s + '|>'
 
+####################################################
+# RData-Decoders
+####################################################
 def ip32bitstr(addr):
   ip = [0 for i in range(4)]
   ip[0] = str(math.floor(addr / 16777216))
@@ -28,175 +186,291 @@ def ip32bitstr(addr):
   ip[3] = str(addr % 256)
   return '.'.join(ip)
 
-def kDNSType_A(data, offset, length) -> RData:
-  rdata = RData()
+def kDNSType_A(data, offset, length, table=None) -> RData:
   if length != 4:
     raise IndexError('Length != 4')
 
-  ipAddr32Bit = mdns.u32(data, offset)
-  setattr(rdata, 'addr', ip32bitstr(ipAddr32Bit))
-  return rdata
+  return RDataA(ip32bitstr(mdns.u32(data, offset)))
 
-def kDNSType_SRV(data, offset, length) -> RData:
+def kDNSType_SRV(data, offset, length, table=None) -> RData:
   if length < 7:
     raise IndexError('len(data) < 7')
-  
-  rd = RData()
-  setattr(rd, 'priority', mdns.u16(data, offset))
-  setattr(rd, 'weight', mdns.u16(data, offset+2))
-  setattr(rd, 'port', mdns.u16(data, offset+4))
-  setattr(rd, 'target', mdns.get_qname(data, offset+6))
-  return rd
-
-def kDNSType_MemCpy(data, offset, length) -> RData:
-  rd = RData()
-  setattr(rd, 'payload', data[offset:offset+length])
-  return rd
-
-def kDNSType_OPT(data, offset, length) -> RData:
+
+  priority, weight, port = _SRV_FIELDS(data, offset)
+  return RDataSRV(priority, weight, port, mdns.get_qname(data, offset+6, table)[1])
+
+def kDNSType_MemCpy(data, offset, length, table=None) -> RData:
+  return RDataRaw(data[offset:offset+length])
+
+def kDNSType_TXT(data, offset, length, table=None) -> RData:
+  return RDataTXT(data[offset:offset+length])
+
+def kDNSType_OPT(data, offset, length, table=None) -> RData:
   if data[offset] != 0x00:
     raise IndexError('Not a Meta-RR!')
-  
+
   record = mdns.ResourceRecord()
+  record.name = mdns.DomainName()
   index = offset + 1
-  
-  record.type = mdns.u16(data, index)
-  index += 2
-  record.clazz = mdns.u16(data, index)
-  index += 2
-  record.ttl = mdns.u32(data, index)
-  index += 4
-
-  dlen = mdns.u16(data, index)
-  index += 2
-  record.size = index + dlen
+
+  record.type, record.clazz, record.ttl, dlen = _RR_FIELDS(data, index)
+  index += 10
+  end = index + dlen
+  if end > len(data):
+    raise IndexError('Truncated OPT-RR')
+
+  record.size = end - offset
   record.rdlength = dlen
 
-  rd = RData()
   opts = []
-  while index < len(data):
-    o = OPT(code=mdns.u16(data, index), length=mdns.u16(data, index+2))
-    o.opdata = data[index+4:index+4+o.oplength]
-    
-    opts.append(o)
-    index += 4 + o.oplength
-  
-  setattr(rd, 'options', opts)
-  record.rdata = rd
+  while index + 4 <= end:
+    code, olen = _OPT_FIELDS(data, index)
+    opts.append(OPT(code, olen, data[index+4:index+4+olen]))
+    index += 4 + olen
+
+  record.rdata = RDataOPT(opts)
   return record
 
-def kDNSType_MX(data, offset, length) -> RData:
-  return __kDNSType_PR_DN(data, offset, length)
-
-def kDNSType_AFSDB(data, offset, length) -> RData:
-  return __kDNSType_PR_DN(data, offset, length)
-
-def kDNSType_RT(data, offset, length) -> RData:
-  return __kDNSType_PR_DN(data, offset, length)
-
-def kDNSType_KX(data, offset, length) -> RData:
-  return __kDNSType_PR_DN(data, offset, length)
-
-def __kDNSType_PR_DN(data, offset, length) -> RData:
-  rd = RData()
-  setattr(rd, 'preference', mdns.u16(data, offset))
-  setattr(rd, 'target', mdns.get_qname(data, offset+2))
-  return rd
-
-def kDNSType_DN(data, offset, length, count=1, names=None) -> RData:
-  index, name = mdns.get_qname(data, offset)
-
-  rd = RData()
-  setattr(rd, 'name', name)
-  if count > 1:
-    __index = index
-    for i in range(1, count):
-      i2, name = mdns.get_qname(data, __index)
-      __index = i2
-      setattr(rd, names[i-1], name)
-  return rd
-
-def kDNSType_SOA(data, offset, length) -> RData:
-  rd = RData()
-  
-  index, mname = mdns.get_qname(data, offset)
-  i2, rname = mdns.get_qname(data, index)
-
-  setattr(rd, 'mname', mname)
-  setattr(rd, 'rname', rname)
-  setattr(rd, 'serial', mdns.u32(data, i2))
-  setattr(rd, 'refresh', mdns.u32(data, i2+4))
-  setattr(rd, 'retry', mdns.u32(data, i2+8))
-  setattr(rd, 'expire', mdns.u32(data, i2+12))
-  setattr(rd, 'minimum', mdns.u32(data, i2+16))
-
-def kDNSType_HINFO(data, offset, length) -> RData:
+def kDNSType_MX(data, offset, length, table=None) -> RData:
+  return RDataMX(mdns.u16(data, offset), mdns.get_qname(data, offset+2, table)[1])
+
+def kDNSType_AFSDB(data, offset, length, table=None) -> RData:
+  return RDataAFSDB(mdns.u16(data, offset), mdns.get_qname(data, offset+2, table)[1])
+
+def kDNSType_RT(data, offset, length, table=None) -> RData:
+  return RDataRT(mdns.u16(data, offset), mdns.get_qname(data, offset+2, table)[1])
+
+def kDNSType_KX(data, offset, length, table=None) -> RData:
+  return RDataKX(mdns.u16(data, offset), mdns.get_qname(data, offset+2, table)[1])
+
+def kDNSType_DN(data, offset, length, table=None) -> RData:
+  return RDataDN(mdns.get_qname(data, offset, table)[1])
+
+def kDNSType_NS(data, offset, length, table=None) -> RData:
+  return RDataNS(mdns.get_qname(data, offset, table)[1])
+
+def kDNSType_CNAME(data, offset, length, table=None) -> RData:
+  return RDataCNAME(mdns.get_qname(data, offset, table)[1])
+
+def kDNSType_PTR(data, offset, length, table=None) -> RData:
+  return RDataPTR(mdns.get_qname(data, offset, table)[1])
+
+def kDNSType_DNAME(data, offset, length, table=None) -> RData:
+  return RDataDNAME(mdns.get_qname(data, offset, table)[1])
+
+def kDNSType_SOA(data, offset, length, table=None) -> RData:
+  index, mname = mdns.get_qname(data, offset, table)
+  i2, rname = mdns.get_qname(data, index, table)
+  return RDataSOA(mname, rname, *_SOA_FIELDS(data, i2))
+
+def kDNSType_HINFO(data, offset, length, table=None) -> RData:
   cpu_len = mdns.u8(data, offset)
   if cpu_len + 1 > length:
     raise IndexError('Malformed CPU-String')
-  
-  rd = RData()
-  
+
   index = offset + 1
-  setattr(rd, 'cpu', data[index:index+cpu_len])
+  cpu = data[index:index+cpu_len]
   index += cpu_len
 
   os_len = mdns.u8(data, index)
-  if os_len + 1 > length:
+  if cpu_len + os_len + 2 > length:
     raise IndexError('Malformed OS-String')
 
   index += 1
-  setattr(rd, 'cpu', data[index:index+os_len])
-  return rd
+  return RDataHINFO(cpu, data[index:index+os_len])
 
-def kDNSType_MINFO(data, offset, length) -> RData:
-  return kDNSType_DN(data, offset, length, count=2, names=["emailbx"])
+def kDNSType_MINFO(data, offset, length, table=None) -> RData:
+  index, name = mdns.get_qname(data, offset, table)
+  return RDataMINFO(name, mdns.get_qname(data, index, table)[1])
 
-def kDNSType_RP(data, offset, length) -> RData:
-  return kDNSType_DN(data, offset, length, count=2, names=["other"])
+def kDNSType_RP(data, offset, length, table=None) -> RData:
+  index, name = mdns.get_qname(data, offset, table)
+  return RDataRP(name, mdns.get_qname(data, index, table)[1])
 
-def kDNSType_PX(data, offset, length) -> RData:
-  pr = mdns.u16(data, offset)
-  rd = kDNSType_DN(data, offset+2, length, count=2, names=["other"])
-  setattr(rd, 'preference', pr)
-  return rd
+def kDNSType_PX(data, offset, length, table=None) -> RData:
+  index, name = mdns.get_qname(data, offset+2, table)
+  return RDataPX(mdns.u16(data, offset), name, mdns.get_qname(data, index, table)[1])
 
-def kDNSType_NSEC(data, offset, length) -> RData:
-  index, name = mdns.get_qname(data, offset)
-  rd = RData()
+def kDNSType_NSEC(data, offset, length, table=None) -> RData:
+  index, name = mdns.get_qname(data, offset, table)
+  end = offset + length
 
-  setattr(rd, 'next_dn', name)
-  bmp_window_block = mdns.u8(data, index) & 1
+  # type bitmaps: <window> <length> <bitmap>, repeated until end of rdata
+  bmp_window_block = mdns.u8(data, index)
   bmp_len = mdns.u8(data, index+1)
-
   bmp = data[index+2:index+2+bmp_len]
+
   bmp_types = []
-  counter = 0
-  for i in range(bmp_len):
-    for shift in range(7, 0, -1):
-      _type = 1 << shift
-      if bmp[i] & _type != 0:
-        dns_rr_type = mdns.DNS_TypeValues[counter]
-        bmp_types.append(dns_rr_type[:2])
-      counter += 1
-    counter += 1
-
-  setattr(rd, 'bitmap', bmp)
-  setattr(rd, 'bitmap_len', bmp_len)
-  setattr(rd, 'bmp_wblock', bmp_window_block)
-  setattr(rd, 'bitmap_types', bmp_types)
-  return rd
-
-def kDNSType_AAAA(data, offset, length) -> RData:
-  ipv6 = ['' for i in range(8)]
-  index = 0
-  for i in range(8):
-    x = mdns.u16(data, offset+index)
-    if x != 0:
-      ipv6[i] = hex(x)[2:]
-    index += 2
-  
-  rd = RData()
-  setattr(rd, 'addr', ':'.join(ipv6).replace('::', ':'))
-  return rd
+  bitmaps = data[index:end]
+  while index + 2 <= end:
+    window = data[index]
+    w_len = data[index+1]
+    for i in range(w_len):
+      for bit in range(8):
+        if data[index+2+i] & (0x80 >> bit):
+          _type = window * 256 + i * 8 + bit
+          dns_rr_type = mdns.DNS_TypeValues.get(_type)
+          bmp_types.append(dns_rr_type[:2] if dns_rr_type else ('TYPE%d' % _type, ''))
+    index += 2 + w_len
+
+  return RDataNSEC(name, bmp, bmp_len, bmp_window_block, bmp_types, bitmaps)
+
+# RFC 5952 text form: the longest run of two or more zero groups becomes '::'
+def ip128bitstr(groups):
+  start, length = -1, 1
+  i = 0
+  while i < 8:
+    if groups[i] == 0:
+      j = i
+      while j < 8 and groups[j] == 0:
+        j += 1
+      if j - i > length:
+        start, length = i, j - i
+      i = j
+    else:
+      i += 1
+
+  parts = ['%x' % x for x in groups]
+  if start < 0:
+    return ':'.join(parts)
+  return ':'.join(parts[:start]) + '::' + ':'.join(parts[start+length:])
+
+def kDNSType_AAAA(data, offset, length, table=None) -> RData:
+  if length != 16:
+    raise IndexError('Length != 16')
+
+  return RDataAAAA(ip128bitstr(_AAAA_FIELDS(data, offset)))
+
+####################################################
+# RData-Encoders
+####################################################
+_U16 = struct.Struct('!H').pack
+
+# Appends a domain name (DomainName or label sequence) to buf. names is the
+# compression table of the message being built (label suffix -> offset of
+# its first occurrence): known suffixes are written as pointers and new
+# ones are added. Without a table the name is written in full.
+def write_name(buf, name, names=None):
+  labels = tuple(name.raw_name) if type(name) == mdns.DomainName else tuple(name)
+  for i in range(len(labels)):
+    if names is not None:
+      suffix = labels[i:]
+      pointer = names.get(suffix)
+      if pointer is not None:
+        buf += _U16(0xC000 | pointer)
+        return
+      if len(buf) <= 0x3FFF:
+        names[suffix] = len(buf)
+
+    label = labels[i].encode('utf-8')
+    buf.append(len(label))
+    buf += label
+  buf.append(0x00)
+
+def _ip4bytes(addr) -> bytes:
+  return bytes(int(x) for x in addr.split('.'))
+
+def _ip6bytes(addr) -> bytes:
+  if '::' in addr:
+    head, tail = addr.split('::')
+    head = head.split(':') if head else []
+    tail = tail.split(':') if tail else []
+    groups = head + ['0'] * (8 - len(head) - len(tail)) + tail
+  else:
+    groups = addr.split(':')
+  if len(groups) != 8:
+    raise ValueError('Invalid IPv6 address: %s' % (addr))
+  return b''.join(_U16(int(x, 16)) for x in groups)
+
+def _encode_A(rdata, buf, names):
+  buf += _ip4bytes(rdata.addr)
+
+def _encode_AAAA(rdata, buf, names):
+  buf += _ip6bytes(rdata.addr)
+
+def _encode_Raw(rdata, buf, names):
+  buf += rdata.payload
+
+def _encode_DN(rdata, buf, names):
+  write_name(buf, rdata.name, names)
+
+def _encode_MINFO(rdata, buf, names):
+  write_name(buf, rdata.name, names)
+  write_name(buf, rdata.emailbx, names)
+
+def _encode_RP(rdata, buf, names):
+  write_name(buf, rdata.name, names)
+  write_name(buf, rdata.other, names)
+
+def _encode_PX(rdata, buf, names):
+  buf += _U16(rdata.preference)
+  _encode_RP(rdata, buf, names)
+
+def _encode_MX(rdata, buf, names):
+  buf += _U16(rdata.preference)
+  write_name(buf, rdata.target, names)
+
+def _encode_SRV(rdata, buf, names):
+  # the target is never compressed (RFC 2782)
+  buf += _SRV_PACK(rdata.priority, rdata.weight, rdata.port)
+  write_name(buf, rdata.target)
+
+def _encode_SOA(rdata, buf, names):
+  write_name(buf, rdata.mname, names)
+  write_name(buf, rdata.rname, names)
+  buf += _SOA_PACK(rdata.serial, rdata.refresh, rdata.retry, rdata.expire, rdata.minimum)
+
+def _encode_HINFO(rdata, buf, names):
+  for x in (rdata.cpu, rdata.os):
+    buf.append(len(x))
+    buf += x
+
+def _encode_NSEC(rdata, buf, names):
+  write_name(buf, rdata.next_dn)
+  if rdata.bitmaps is not None:
+    buf += rdata.bitmaps
+  else:
+    # built by hand: a single window
+    buf.append(rdata.bmp_wblock)
+    buf.append(rdata.bitmap_len)
+    buf += rdata.bitmap
+
+def _encode_OPT(rdata, buf, names):
+  for opt in rdata.options:
+    buf += _OPT_PACK(opt.opcode, len(opt.opdata))
+    buf += opt.opdata
+
+_SRV_PACK = struct.Struct('!HHH').pack
+_SOA_PACK = struct.Struct('!IIIII').pack
+_OPT_PACK = struct.Struct('!HH').pack
+
+RDATA_ENCODERS = {
+  RDataRaw: _encode_Raw,
+  RDataTXT: _encode_Raw,
+  RDataA: _encode_A,
+  RDataAAAA: _encode_AAAA,
+  RDataDN: _encode_DN,
+  RDataNS: _encode_DN,
+  RDataCNAME: _encode_DN,
+  RDataPTR: _encode_DN,
+  RDataDNAME: _encode_DN,
+  RDataMINFO: _encode_MINFO,
+  RDataRP: _encode_RP,
+  RDataPX: _encode_PX,
+  RDataMX: _encode_MX,
+  RDataAFSDB: _encode_MX,
+  RDataRT: _encode_MX,
+  RDataKX: _encode_MX,
+  RDataSRV: _encode_SRV,
+  RDataSOA: _encode_SOA,
+  RDataHINFO: _encode_HINFO,
+  RDataNSEC: _encode_NSEC,
+  RDataOPT: _encode_OPT
+}
 
+# Appends the wire format of rdata to buf (see write_name for names).
+def write_rdata(buf, rdata, names=None):
+  encoder = RDATA_ENCODERS.get(type(rdata))
+  if encoder is None:
+    raise TypeError('Unsupported RData: %s' % (type(rdata).__name__))
+  encoder(rdata, buf, names)
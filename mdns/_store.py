@@ -0,0 +1,117 @@
+import mdns
+
+from ._batch import _numpy
+
+# Column layout of the record store. Every question and resource record
+# of a message becomes one row; source and name are ids into the
+# dictionaries kept next to the columns.
+RECORD_FIELDS = [
+  ('timestamp', 'f8'),
+  ('source', 'u4'),
+  ('section', 'u1'),
+  ('rrtype', 'u2'),
+  ('rrclass', 'u2'),
+  ('ttl', 'u4'),
+  ('cache_flush', '?'),
+  ('name', 'u4')
+]
+
+SECTION_QUESTION = 0
+SECTION_ANSWER = 1
+SECTION_AUTHORITY = 2
+SECTION_ADDITIONAL = 3
+
+class RecordStore:
+  def __init__(self, chunk_size=65536) -> None:
+    np = _numpy()
+    self.chunk_size = chunk_size
+    self._dtype = np.dtype(RECORD_FIELDS)
+    self._chunks = []
+    self._chunk = np.empty(chunk_size, dtype=self._dtype)
+    self._fill = 0
+
+    # dictionary encoding of names and sources
+    self.names = []
+    self.sources = []
+    self._name_ids = {}
+    self._source_ids = {}
+
+  def __len__(self) -> int:
+    return len(self._chunks) * self.chunk_size + self._fill
+
+  def __str__(self) -> str:
+    return '<RecordStore rows=%d names=%d sources=%d |>' % (len(self), len(self.names), len(self.sources))
+
+  def name_id(self, name) -> int:
+    key = str(name)
+    i = self._name_ids.get(key)
+    if i is None:
+      i = len(self.names)
+      self._name_ids[key] = i
+      self.names.append(key)
+    return i
+
+  def source_id(self, source) -> int:
+    i = self._source_ids.get(source)
+    if i is None:
+      i = len(self.sources)
+      self._source_ids[source] = i
+      self.sources.append(source)
+    return i
+
+  def _append_row(self, row):
+    if self._fill == self.chunk_size:
+      self._chunks.append(self._chunk)
+      self._chunk = _numpy().empty(self.chunk_size, dtype=self._dtype)
+      self._fill = 0
+    self._chunk[self._fill] = row
+    self._fill += 1
+
+  # Appends one row per question and resource record of the message.
+  def append(self, message, timestamp, source) -> int:
+    src = self.source_id(source)
+    count = 0
+    for q in message.questions:
+      self._append_row((timestamp, src, SECTION_QUESTION, q.qtype,
+                        q.qclass & ~mdns.types.DNS_QCLASS_UR, 0, False, self.name_id(q.qname)))
+      count += 1
+
+    for section, records in enumerate((message.answers, message.authorities, message.additionalRR), start=1):
+      for r in records:
+        self._append_row((timestamp, src, section, r.type, r.clazz & ~mdns.types.DNS_CLASS_URR,
+                          r.ttl, r.has_cache_flush(), self.name_id(r.name)))
+        count += 1
+    return count
+
+  # All rows as one structured array
+  def records(self):
+    np = _numpy()
+    return np.concatenate(self._chunks + [self._chunk[:self._fill]])
+
+  # Distinct values of a column together with their counts
+  def histogram(self, column) -> tuple:
+    return _numpy().unique(self.records()[column], return_counts=True)
+
+  def save(self, path):
+    np = _numpy()
+    np.savez_compressed(path, records=self.records(),
+                        names=np.array(self.names, dtype=str),
+                        sources=np.array(self.sources, dtype=str))
+
+  @staticmethod
+  def load(path, chunk_size=65536):
+    np = _numpy()
+    store = RecordStore(chunk_size)
+    with np.load(path, allow_pickle=False) as f:
+      records = f['records']
+      store.names = [str(x) for x in f['names']]
+      store.sources = [str(x) for x in f['sources']]
+
+    store._name_ids = {x: i for i, x in enumerate(store.names)}
+    store._source_ids = {x: i for i, x in enumerate(store.sources)}
+    for i in range(0, len(records) - store.chunk_size + 1, store.chunk_size):
+      store._chunks.append(records[i:i + store.chunk_size].copy())
+    rest = records[len(store._chunks) * store.chunk_size:]
+    store._chunk[:len(rest)] = rest
+    store._fill = len(rest)
+    return store
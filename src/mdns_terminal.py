@@ -1,17 +1,39 @@
 """
 Allowed/Implemented commands of this terminal:
-  [a]  capture --host HOST [-a/--amount PACKET_AMOUNT] [-s/--save PATH [--save-live] [--format FORMAT]]
-  [b]  discov [--services SERVICES]
+  [a]  capture --host HOST [-a/--amount PACKET_AMOUNT] [-s/--save PATH [--save-live] [--format FORMAT]] [--npz PATH]
+               [--rotate-size SIZE] [--rotate-time SECONDS] [--compress gzip|lzma] [--max-memory SIZE]
+               [--stats SECONDS] [--top-k K]
+               [--qr query|response] [--qtype TYPE] [--name SUFFIX]
+  [b]  discov [--services SERVICES] [-t/--timeout SECONDS]
+  [c]  capv2 --host HOST [--log PATH] [--stats SECONDS] [--top-k K] [--qr query|response] [--qtype TYPE] [--name SUFFIX]
+  [d]  analyze FILE [FILE ...] [-j/--jobs JOBS] [--chunk-size MB] [--top N] [--port PORT]
+               [--eps EPS] [--delta DELTA]
 """
 import argparse
+import asyncio
+import os
 import sys
 import socket
 import pprint
+import shutil
+import tempfile
+import time
 
+# the mdns-API v2 package is located in the repository root
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mdns as mdnsv2
+
+from protocol._offline import analyze as analyze_files
+from protocol._writer import LiveWriter, COMPRESSORS
 from protocol._analyzing import (
   mDNSFormatter,
   TABLE_HEADER,
   IMPLEMENTED_FORMATS,
+  IF_PCAP,
+  IF_TXT,
+  FT_ADDR,
+  FT_PACKET,
+  FT_TABLE,
   WT_ADDR,
   WT_PACKET,
   WT_TABLE,
@@ -26,6 +48,7 @@ CMD_CAPTURE  = 'cap'
 CMD_CAPTURE2 = 'capv2'
 CMD_EXIT     = 'exit'
 CMD_DISCOV   = 'discov'
+CMD_ANALYZE  = 'analyze'
 
 # Add your own fancy prompt here
 if sys.platform == 'win32':
@@ -56,6 +79,7 @@ class ArgParserWrapper(argparse.ArgumentParser):
 psr_capture  = ArgParserWrapper(CMD_CAPTURE)
 psr_discov   = ArgParserWrapper(CMD_DISCOV)
 psr_capture2 = ArgParserWrapper(CMD_CAPTURE2)
+psr_analyze  = ArgParserWrapper(CMD_ANALYZE)
 
 mdns_psr    = mdns.mDNSParser()
 mdns_form   = mDNSFormatter()
@@ -68,13 +92,81 @@ def add_capture_args():
   group.add_argument('--save-live', action='store_true')
   group.add_argument('--format', type=str, default='txt', required=False)
   group.add_argument('--bcast', type=str, default=mdns.IPV4_MCAST_IP, required=False)
+  group.add_argument('--rotate-size', type=str, default=None, required=False)
+  group.add_argument('--rotate-time', type=float, default=None, required=False)
+  group.add_argument('--compress', type=str, default=None, choices=list(COMPRESSORS), required=False)
+  group.add_argument('--max-memory', type=str, default='256M', required=False)
+  psr_capture.add_argument('--npz', type=str, default=None, required=False)
+  add_filter_args(psr_capture)
+  add_stats_args(psr_capture)
+
+# filter options shared by the capture commands, see build_prefilter()
+def add_filter_args(parser):
+  group = parser.add_argument_group()
+  group.add_argument('--qr', type=str, default=None, choices=['query', 'response'], required=False)
+  group.add_argument('--qtype', type=str, default=None, required=False)
+  group.add_argument('--name', type=str, default=None, required=False)
+
+# source statistics shared by the capture commands, see print_stats()
+def add_stats_args(parser):
+  group = parser.add_argument_group()
+  group.add_argument('--stats', type=float, default=None, required=False)
+  group.add_argument('--top-k', type=int, default=None, required=False)
 
 def add_discov_args():
   psr_discov.add_argument('--services', type=str, default=None, required=False)
   psr_discov.add_argument('--host', type=str, default=None) 
+  psr_discov.add_argument('-t', '--timeout', type=float, default=3.0, required=False)
 
 def add_capture2_args():
   psr_capture2.add_argument('--host', type=str, default=None) 
+  psr_capture2.add_argument('--log', type=str, default=None, required=False)
+  add_filter_args(psr_capture2)
+  add_stats_args(psr_capture2)
+
+def add_analyze_args():
+  psr_analyze.add_argument('files', type=str, nargs='+')
+  psr_analyze.add_argument('-j', '--jobs', type=int, default=None, required=False)
+  psr_analyze.add_argument('--chunk-size', type=int, default=32, required=False)
+  psr_analyze.add_argument('--top', type=int, default=10, required=False)
+  psr_analyze.add_argument('--port', type=int, default=5353, required=False)
+  psr_analyze.add_argument('--eps', type=float, default=0.001, required=False)
+  psr_analyze.add_argument('--delta', type=float, default=0.01, required=False)
+
+# Converts a size like '512K', '256M' or '1G' into bytes.
+def parse_size(text) -> int:
+  units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+  text = text.strip().upper().rstrip('B')
+  if text and text[-1] in units:
+    return int(float(text[:-1]) * units[text[-1]])
+  return int(text)
+
+def print_stats(stats, n=10):
+  print(BLUE + '\n[*] ' + ENDC + '%d packet(s), %d byte(s), %d record(s) from %d source(s)' % (
+    stats.packets, stats.bytes, stats.records, len(stats)))
+  print(" Address                    Packets      Bytes  Records")
+  for source, packets, nbytes, records, error in stats.top(n):
+    print(' %-24s %9s %10d %8d' % (source, ('~%d' % packets) if error else packets, nbytes, records))
+
+# Creates a callable that peeks at a raw datagram and decides whether it
+# should be parsed at all. Returns None if no filter option was given.
+def build_prefilter(args):
+  if not args or not (args.qr or args.qtype or args.name):
+    return None
+
+  qtype_ = None
+  if args.qtype:
+    if args.qtype.isdigit():
+      qtype_ = int(args.qtype)
+    else:
+      for k, v in mdnsv2.DNS_TypeValues.items():
+        if v[0] == args.qtype.upper():
+          qtype_ = k
+          break
+      if qtype_ is None:
+        raise ValueError('Unknown record type: %s' % (args.qtype))
+
+  return mdnsv2.PeekFilter(qr=args.qr, qtype=qtype_, suffix=args.name).match
 
 # parses the input from terminal
 def let_parse(parser: ArgParserWrapper, line, method, isHelp) -> argparse.Namespace:
@@ -103,7 +195,23 @@ def __capture__(args, is_help):
   @save_now (-save-live): this option stores all packets while capturing. Only 
   in combination with -s/--save; NOTE: the ip-addresses are saved after the 
   capture is done 
-  @format (--format): sets the storing format - currently implemented: txt
+  @format (--format): sets the storing format - currently implemented: txt, json,
+  jsonl (one object per line) and pcap (raw datagrams with timestamps, the ip-addresses are saved as txt)
+  @npz (--npz): additionally decodes every record into a columnar store which
+  is exported to the given .npz file after the capture
+  @rotate_size (--rotate-size) / @rotate_time (--rotate-time): starts a new
+  file segment once the current one has the given size (e.g. 64M) or age in
+  seconds
+  @compress (--compress): compresses closed segments with gzip or lzma
+  @max_memory (--max-memory): without --save-live the raw packets are kept
+  until the capture ends; beyond this budget (default 256M) they are spilled
+  to a temporary file on disk
+  @stats (--stats): prints the per-source statistics every given seconds
+  @top_k (--top-k): only tracks the K most active sources (approximately, with
+  bounded memory) instead of counting every source exactly
+
+  The files are written by a background thread, so the receive loop never
+  waits for the disk.
   '''
   #if help command is requested, no code should be executed
   if is_help:
@@ -128,9 +236,11 @@ def __capture__(args, is_help):
   save_     = args.save if args else None
   save_now_ = args.save_live if args else False
   format_   = args.format if args else 'txt'
+  npz_      = args.npz if args else None
+  stats_    = mdnsv2.SourceStats(args.top_k if args else None)
+  interval_ = args.stats if args else None
   
   if save_:
-    ip = {}
     x = f"mdns-{datetime.now().strftime('%d-%m-%Y.%H%M%S')}"
     mkdir(SEP.join([save_, x]))
     save_ += SEP + x
@@ -138,18 +248,28 @@ def __capture__(args, is_help):
   if format_ not in IMPLEMENTED_FORMATS:
     format_ = 'txt'
 
-  # to save the packets a list is used
-  if not save_now_ and save_:
-    packet_list = []
+  # pcap output is always written while capturing: the datagrams are stored
+  # unparsed through a large buffer, so there is nothing to collect
+  pcap_ = save_ is not None and format_ == IF_PCAP
+  if pcap_:
+    file_pcap = mdnsv2.PcapWriter(SEP.join([save_, FT_PACKET + '.' + IF_PCAP]))
+    save_now_ = False
+
+  # the raw packets are buffered and parsed again when the files are written
+  if not save_now_ and save_ and not pcap_:
+    packet_list = mdnsv2.SpillBuffer(parse_size(args.max_memory))
 
-  if save_ and save_now_:
-    file_table   = mdns_form.openf(save_, "packet-table", format_)
-    file_packets = mdns_form.openf(save_, "packets", format_)
-    file_ip      = mdns_form.openf(save_, "ip-addr", format_)
+  if save_ and not pcap_:
+    writer_ = LiveWriter(save_, format_,
+                         max_size=parse_size(args.rotate_size) if args.rotate_size else None,
+                         max_age=args.rotate_time, compress=args.compress)
 
   if amount_ > 0:
     counter = 0
 
+  if npz_:
+    store = mdnsv2.RecordStore()
+
   mdns_form.c = 0
   print("[i] Receiving packets on host: %s " % (host_))
   if amount_ > 0:
@@ -159,31 +279,39 @@ def __capture__(args, is_help):
     print('[i] Saving while parsing enabled: <path= "%s">' % (save_))
 
   print('\n' + TABLE_HEADER)
+  next_stats = time.monotonic() + interval_ if interval_ else None
   try:
-    for packet, addr in mdns_client.foreach():
+    for packet, addr in mdns_client.foreach(prefilter=build_prefilter(args)):
       if amount_ > 0:
         counter += 1
 
-      qu_data = mdns_psr.parse(packet, addr=addr)
-      mdns_form.printf(qu_data, addr=addr)
+      # pcap output stores the datagrams as they are, they are not parsed
+      if pcap_:
+        mdns_form.printp(mdnsv2.peek(packet), addr)
+      else:
+        qu_data = mdns_psr.parse(packet, addr=addr)
+        mdns_form.printf(qu_data, addr=addr)
+
+      stats_.add_datagram(str(addr[0]), packet)
+      if next_stats and time.monotonic() >= next_stats:
+        print_stats(stats_)
+        next_stats = time.monotonic() + interval_
+
+      if npz_:
+        try:
+          store.append(mdnsv2.loadm(packet), time.time(), str(addr[0]))
+        except Exception:
+          pass
+
+      if pcap_:
+        file_pcap.write(packet, addr)
       
       if save_now_ and save_ is not None:
-        mdns_form.writef(qu_data, file_table, writetype=WT_TABLE, format=format_)
-        mdns_form.writef(qu_data, file_packets, writetype=WT_PACKET, format=format_)
-
-      if save_:
-        found = False
-        for k in ip:
-          if k == str(addr[0]):
-            ip[k] += 1
-            found = True
-            break
-        
-        if not found:
-          ip.setdefault(str(addr[0]), 1)
+        writer_.submit(FT_TABLE, WT_TABLE, (qu_data, addr[0]), mdns_form.c)
+        writer_.submit(FT_PACKET, WT_PACKET, (qu_data, addr[0]), mdns_form.c)
 
-      if not save_now_ and save_:
-        packet_list.append((qu_data, addr[0]))
+      if not save_now_ and save_ and not pcap_:
+        packet_list.append(packet, addr)
 
       if amount_ > 0:
         if counter >= amount_:
@@ -194,27 +322,42 @@ def __capture__(args, is_help):
 
   if save_:
     print("\n[i] Saving to specified folder: %s" % (save_))
-    if save_now_:
-      mdns_form.writef(ip, file_ip, writetype=WT_ADDR)
+    if pcap_:
+      file_pcap.close()
+      file_ip = mdns_form.openf(save_, FT_ADDR, IF_TXT)
+      mdns_form.writef(stats_.as_dict(), file_ip, writetype=WT_ADDR, format=IF_TXT)
+      mdns_form.closef(file_ip, IF_TXT)
+      print("[i] Wrote %d packet(s) to: %s" % (file_pcap.count, file_pcap.path))
     else:
-      file_table   = mdns_form.openf(save_, "packet-table", format_)
-      file_packets = mdns_form.openf(save_, "packets", format_)
-      file_ip      = mdns_form.openf(save_, "ip-addr", format_)
-
-      mdns_form.writef(ip, file_ip, writetype=WT_ADDR, format=format_)
-      mdns_form.c = 0
-      for p in packet_list:
-        mdns_form.writef(p, file_table, writetype=WT_TABLE, format=format_)
-        mdns_form.writef(p, file_packets, writetype=WT_PACKET, format=format_)
-        mdns_form.c += 1
-
-    mdns_form.closef(file_ip, format_)
-    mdns_form.closef(file_packets, format_)
-    mdns_form.closef(file_table, format_)
+      writer_.submit(FT_ADDR, WT_ADDR, stats_.as_dict())
+      if not save_now_:
+        if packet_list.spilled:
+          print('[i] %d packet(s) were spilled to disk' % (packet_list.spilled))
+        for c, (_, src, data) in enumerate(packet_list):
+          p = (mdns_psr.parse(data, addr=(src, 5353)), src)
+          writer_.submit(FT_TABLE, WT_TABLE, p, c)
+          writer_.submit(FT_PACKET, WT_PACKET, p, c)
+        packet_list.close()
+
+      writer_.close()
+      if writer_.errors:
+        print(WARNING + '[!] %s' % (writer_) + ENDC)
+
+  if npz_:
+    store.save(npz_)
+    print("[i] Exported %d record(s) to: %s" % (len(store), npz_))
   
   mdns_client.close()
 
 def __capture2__(args, is_help):
+  '''
+  Captures mDNS-Packets into an append-only packet log on disk (pcap file plus
+  offset index), so any captured packet can be picked and decoded afterwards
+  without keeping the packets in memory:
+
+  @log (--log): path of the packet log; by default a temporary log is used
+  which is removed when the command returns
+  '''
   if is_help:
     return
 
@@ -222,65 +365,154 @@ def __capture2__(args, is_help):
   if not host_:
     return
 
+  log_ = args.log if args else None
+  if log_:
+    log_dir = None
+  else:
+    log_dir = tempfile.mkdtemp(prefix='mdns-')
+    log_ = SEP.join([log_dir, FT_PACKET + '.' + IF_PCAP])
+
   mdns_client = mdns.MulticastDNSListener(address=host_)
-  packet_list = []
-  ip          = {}
+  packet_log  = mdnsv2.PacketLog(log_)
+  stats_      = mdnsv2.SourceStats(args.top_k if args else None)
+  interval_   = args.stats if args else None
 
+  start = time.time()
+  next_stats = time.monotonic() + interval_ if interval_ else None
   print('\n' + TABLE_HEADER)
   try:
-    for packet, addr in mdns_client.foreach():
+    for packet, addr in mdns_client.foreach(prefilter=build_prefilter(args)):
       qu_data = mdns_psr.parse(packet, addr=addr)
       mdns_form.printf(qu_data, addr=addr)
-      
-      found = False
-      for k in ip:
-        if k == str(addr[0]):
-          ip[k] += 1
-          found = True
-          break
-        
-      if not found:
-          ip.setdefault(str(addr[0]), 1)
 
-      packet_list.append((qu_data, addr[0]))
+      stats_.add_datagram(str(addr[0]), packet)
+      if next_stats and time.monotonic() >= next_stats:
+        print_stats(stats_)
+        next_stats = time.monotonic() + interval_
+
+      packet_log.append(packet, addr)
   except Exception as e:
     print("\n[!] Stopped at Excepion<e = %s>" % (e))
 
-  print("\n[*] Captured %d packet(s) in %ss" %  (len(packet_list), 'x'))
-  if len(packet_list) > 0:
-    print(" Address           No. of packets")
-    for k in ip:
-      x = str(k); y = str(ip[k])
-      if len(x) == 13:
-          x += ' '*2
-      elif len(x) == 14:
-          x += ' '
-      print(' ' + ''.join([x, ' '*6, y]))
+  print("\n[*] Captured %d packet(s) in %.2fs" %  (len(packet_log), time.time() - start))
+  if len(packet_log) > 0:
+    print_stats(stats_, n=None)
 
     while True:
       try:
         print(BLUE + '\n[*]' +ENDC+ 'Press ^C to end process and go back to home or choose packet to analyze:')
         i = int(input('[No.] --> '))
         
-        if 0 <= i <= len(packet_list):
-          p = packet_list[i - 1][0]
+        if 1 <= i <= len(packet_log):
+          # only the selected packet is read back and parsed
+          _, src, data = packet_log.get(i - 1)
+          p = mdns_psr.parse(data, addr=(src, 5353))
           print('[>] Packet no. (%d):\n' % (i))
           pprint.pprint(p)
       except:
           break
+
+  packet_log.close()
+  if log_dir:
+    shutil.rmtree(log_dir, ignore_errors=True)
+  else:
+    print('[i] Packet log saved to: %s' % (log_))
   
+# records received by discov, see __discov__
+discov_cache = None
+
 def __discov__(args, is_help):
+  '''
+  Browses DNS-SD services and resolves every instance to its host, port,
+  addresses and TXT record. Services are printed as soon as they are resolved:
+
+  @services (--services): comma separated service types, e.g. _http._tcp,_ipp._tcp;
+  by default all types announced on the network are browsed
+  @timeout (-t or --timeout): duration of the browse in seconds
+
+  Records are kept for the whole session and sent as known answers, so
+  running discov again only brings up what changed on the network.
+  '''
+  global discov_cache
   if is_help:
     return
   host_  = args.host if args and args.host else capture_host()
   if not host_:
     return
-  
-  mdns_client = mdns.MulticastDNSListener(address=host_)
-  services_   = args.services
 
-  if not services_:
-    services_ = ['_tcp', '_rstp', '_ftp', ...]
+  services_ = [x for x in args.services.split(',') if x] if args and args.services else None
+  timeout_  = args.timeout if args else 3.0
+  if discov_cache is None:
+    discov_cache = mdnsv2.RecordCache()
+
+  async def run(found):
+    async for info in mdnsv2.browse(services_, timeout=timeout_, cache=discov_cache, address=host_):
+      found.append(info)
+      print(' %-4d %-40s %-28s %-32s %s' % (
+        len(found), info.name, '%s:%d' % (info.host, info.port), ', '.join(info.addresses),
+        ' '.join(str(x, 'utf-8', 'replace') for x in info.txt)))
+
+  print("[i] Browsing %s for %.1fs" % (', '.join(services_) if services_ else 'all services', timeout_))
+  print('\n No.  Instance                                 Host                         Addresses                        TXT')
+  found = []
+  try:
+    asyncio.run(run(found))
+  except KeyboardInterrupt:
+    pass
+  print("\n[*] Resolved %d service(s)" % (len(found)))
+
+def __analyze__(args, is_help):
+  '''
+  Analyzes one or more capture files (pcap/pcapng) offline. The files are
+  split into chunks which are decoded in parallel by a pool of processes:
+
+  @jobs (-j or --jobs): number of worker processes (default: one per CPU)
+  @chunk_size (--chunk-size): size of a chunk in MB
+  @top (--top): number of entries to print per table
+  @port (--port): UDP port of the captured traffic
+  @eps (--eps) / @delta (--delta): error bounds of the top services and query
+  names, which are estimated in fixed memory: a count is overestimated by at
+  most eps * total with probability 1 - delta
+  '''
+  if is_help:
+    return
+  if not args or not args.files:
+    psr_analyze.print_usage()
+    return
+
+  start = time.time()
+  try:
+    summary = analyze_files(args.files, jobs=args.jobs, chunk_size=max(1, args.chunk_size) << 20,
+                            port=args.port, eps=args.eps, delta=args.delta)
+  except (OSError, ValueError) as e:
+    print(WARNING + '[!] Could not analyze files: %s' % (e) + ENDC)
+    return
+
+  print("[*] Analyzed %d packet(s) from %d file(s) in %.2fs" % (
+    summary.packets, len(args.files), time.time() - start))
+  if summary.errors:
+    print(WARNING + "[!] %d packet(s) could not be decoded" % (summary.errors) + ENDC)
+  if summary.first is not None:
+    print("[i] Time range: %s - %s" % (datetime.fromtimestamp(summary.first),
+                                         datetime.fromtimestamp(summary.last)))
+
+  def print_counter(title, items, label=str):
+    if not items:
+      return
+    print('\n ' + title)
+    for k, v in items:
+      print(' %-40s %d' % (label(k), v))
+
+  def type_name(k):
+    return mdnsv2.DNS_TypeValues[k][0] if k in mdnsv2.DNS_TypeValues else str(k)
+
+  print_counter('Address                                  No. of packets', summary.sources.most_common(args.top))
+  print_counter('Query type                               No. of questions', summary.qtypes.most_common(args.top), type_name)
+  print_counter('Record type                              No. of records', summary.rrtypes.most_common(args.top), type_name)
+  print_counter('TTL                                      No. of records', summary.ttls.most_common(args.top))
+  # estimated (upper bounds), see mdns.CountMinSketch
+  print_counter('Top services                             ~No. of PTR names', summary.services.top(args.top))
+  print_counter('Top query names                          ~No. of questions', summary.qnames.top(args.top))
 
 def capture_host():
   print("\n[i] No host specified, select one of the following ones:")
@@ -302,6 +534,7 @@ COMMANDS = [
   (CMD_CAPTURE, __capture__, psr_capture),
   (CMD_DISCOV, __discov__, psr_discov),
   (CMD_CAPTURE2, __capture2__, psr_capture2),
+  (CMD_ANALYZE, __analyze__, psr_analyze),
   (CMD_EXIT, exit, None)
 ]
 
@@ -320,7 +553,7 @@ def _react(line: str):
 
 # BaseModule definition would follow here
 if __name__ == '__main__':
-  ARGS_ADD = [add_capture_args, add_discov_args, add_capture2_args]
+  ARGS_ADD = [add_capture_args, add_discov_args, add_capture2_args, add_analyze_args]
   for ax in ARGS_ADD:
     ax()
   
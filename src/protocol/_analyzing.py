@@ -1,4 +1,6 @@
+import json
 import sys
+import time
 
 from protocol.mdns import *
 
@@ -18,8 +20,12 @@ ADDR_HEADER = " Address              No. of packets"
 
 IF_TXT  = 'txt'
 IF_JSON = 'json'
+# one JSON object per line
+IF_JSONL = 'jsonl'
+# raw datagrams in libpcap format, written through mdns.PcapWriter
+IF_PCAP = 'pcap'
 
-IMPLEMENTED_FORMATS = [IF_TXT, IF_JSON]
+IMPLEMENTED_FORMATS = [IF_TXT, IF_JSON, IF_JSONL, IF_PCAP]
 
 #WRITE_TYPE = ['table', 'packet', 'addr']
 WT_TABLE   = 1
@@ -32,6 +38,26 @@ FT_ADDR   = "ip-addr"
 
 MAX_TABLE_LENGTH = 125
 
+# Output files are written through a large buffer (flushed when it is full)
+# and additionally flushed by writef() at most every FLUSH_INTERVAL seconds.
+WRITE_BUFFER   = 1 << 20
+FLUSH_INTERVAL = 1.0
+
+def _json_default(o):
+  if isinstance(o, (bytes, bytearray, memoryview)):
+    return bytes(o).hex()
+  return str(o)
+
+# shared by the JSON formatters, created once
+ENCODER = json.JSONEncoder(separators=(',', ':'), default=_json_default, check_circular=False)
+_encode = ENCODER.encode
+
+# Precomputed record layouts: the keys are rendered once, only the values
+# are encoded per packet.
+JSON_PACKET = '{"no":%d,"source":%s,"header":%s,"body":%s}'
+JSON_TABLE  = '{"no":%d,"source":%s,"dest":"' + IPV4_MCAST_IP + '","port":5353,"data":%s}'
+JSON_ADDR   = '{"ip":%s,"amount":%d}'
+
 
 
 class FileFormatter:
@@ -56,7 +82,7 @@ class FileFormatter:
   def writeA(self, data) -> str:
     pass
 
-  def close() -> str:
+  def close(self) -> str:
     pass
 
 class TXTFormatter(FileFormatter):
@@ -70,20 +96,18 @@ class TXTFormatter(FileFormatter):
     return s
 
   def writeP(self, data, c) -> str:
-      s = ''
       rq = data[0]
       h = rq[HEADER]; b = rq[BODY]
-      s += '[>] Packet: src="%s", no=%d\n  <header>\n' % (data[1], c)
-      for x in h:
-        s += '    %s: %s\n' % (x, h[x])
-      s += '  [body]\n'
+      s = ['[>] Packet: src="%s", no=%d\n  <header>\n' % (data[1], c)]
+      s.extend('    %s: %s\n' % (x, h[x]) for x in h)
+      s.append('  [body]\n')
       for y in b:
-        s += '    [%s]\n' % (y)
+        s.append('    [%s]\n' % (y))
         for i, z in enumerate(b[y]):
-          s += ' '*6 + f'[No={i}]\n'
-          for a in z:
-            s += ' '*8 + '%s: %s\n' % (a, str(z[a]))
-      return s + '\n'
+          s.append(' '*6 + f'[No={i}]\n')
+          s.extend(' '*8 + '%s: %s\n' % (a, z[a]) for a in z)
+      s.append('\n')
+      return ''.join(s)
 
   def writeT(self, data, c) -> str:
     h = len_host(data[1])
@@ -101,31 +125,26 @@ class TXTFormatter(FileFormatter):
   def iniwriteT(self) -> str:
     return TABLE_HEADER
 
-  def close() -> str:
+  def close(self) -> str:
     return ''
 
 class JSONFormatter(FileFormatter):
   def __init__(self) -> None:
     super().__init__(IF_JSON)
 
+  # elements of the array are followed by a comma, the array is terminated
+  # by close()
   def writeP(self, data, c) -> str:
-    return ('{"no": %d,' % (c)) + packetf(data)
+    return packetf(data, c) + ',\n'
   
   def writeA(self, data) -> str:
-    s = ''
-    for k in data:
-      s += '{\n"ip": "%s",\n"amount": %d},\n' % (k, data[k])
-    return s
+    return ''.join([JSON_ADDR % (_encode(k), data[k]) + ',\n' for k in data])
 
   def writeT(self, data, c) -> str:
-    h = len_host(data[1])
-    n = len_num(c)
-
-    dataf = format_data(data[0])
-    return '{' + (TABLE_HEADER_JSON % (n, h, str(dataf).replace('"', "\""))) + '},'
+    return JSON_TABLE % (c, _encode(data[1]), _encode(format_data(data[0]))) + ',\n'
 
   def iniwriteT(self) -> str:
-    return '{"file": "ip-addr.json","table": ['
+    return '{"file": "packet-table.json","table": ['
 
   def iniwriteP(self) -> str:
     return '{"file": "packets.json", "packets": ['
@@ -133,29 +152,56 @@ class JSONFormatter(FileFormatter):
   def iniwriteA(self) -> str:
     return '{"file": "ip-addr.json","style": {"ip": "...","amount": 0},"addr": ['
 
-  def close() -> str:
+  def close(self) -> str:
     return '"noerror"\n]\n}'
 
 
-FORMATTERS = [TXTFormatter(), JSONFormatter()]
+class JSONLFormatter(FileFormatter):
+  def __init__(self) -> None:
+    super().__init__(IF_JSONL)
+
+  def writeP(self, data, c) -> str:
+    return packetf(data, c) + '\n'
+
+  def writeA(self, data) -> str:
+    return ''.join([JSON_ADDR % (_encode(k), data[k]) + '\n' for k in data])
+
+  def writeT(self, data, c) -> str:
+    return JSON_TABLE % (c, _encode(data[1]), _encode(format_data(data[0]))) + '\n'
+
+  def iniwriteT(self) -> str:
+    return ''
+
+  def iniwriteP(self) -> str:
+    return ''
+
+  def iniwriteA(self) -> str:
+    return ''
+
+  def close(self) -> str:
+    return ''
+
+FORMATTERS = [TXTFormatter(), JSONFormatter(), JSONLFormatter()]
 
 class mDNSFormatter:
   def __init__(self) -> None:
     self.c = 0
+    # file -> time of the last flush
+    self._flushed = {}
 
   def openf(self, path, name, f):
-    x = open(SEP.join([path, ".".join([name, f])]), 'w')
+    x = open(SEP.join([path, ".".join([name, f])]), 'w', buffering=WRITE_BUFFER)
     for _F in FORMATTERS:
         if _F.extension == f:
           x.write(_F.iniwriteT() if name == FT_TABLE else _F.iniwriteA() if name == FT_ADDR else _F.iniwriteP())
-    x.flush()
+    self._flushed[x] = time.monotonic()
     return x
 
   def closef(self, file, f):
     for _F in FORMATTERS:
         if _F.extension == f:
           file.write(_F.close())
-    file.flush()
+    self._flushed.pop(file, None)
     file.close()
 
   def printf(self, data: dict, addr):
@@ -166,6 +212,12 @@ class mDNSFormatter:
     dataf = format_data(data)
     print(TABLE_TEMPLATE % (n, h, dataf))
 
+  # Prints the table row of a datagram that is not parsed, built from its
+  # header only (see mdns.peek).
+  def printp(self, info, addr):
+    self.c += 1
+    print(TABLE_TEMPLATE % (len_num(self.c), len_host(addr[0]), format_peek(info)))
+
   def writef(self, data, file, writetype=-1, format=IF_TXT):
     if writetype == -1:
       return
@@ -173,7 +225,13 @@ class mDNSFormatter:
     for _F in FORMATTERS:
         if _F.extension == format:
           file.write(_F.writeT(data, self.c) if writetype == WT_TABLE else _F.writeA(data) if writetype == WT_ADDR else _F.writeP(data, self.c))
-    file.flush()
+
+    # the buffer is written out when it is full; live files are additionally
+    # flushed once per FLUSH_INTERVAL instead of after every packet
+    now = time.monotonic()
+    if now - self._flushed.get(file, now) >= FLUSH_INTERVAL:
+      file.flush()
+      self._flushed[file] = now
 
 def len_host(host) -> str:
   if len(host) == 14:
@@ -239,11 +297,25 @@ def format_data(qu_data) -> str:
 
   return s + '...'
 
+def format_peek(info) -> str:
+  if info is None:
+    return 'Invalid datagram'
+
+  s = '%s 0x%04x, ' % ('Standard query response' if info.is_response else 'Standard query', info.id)
+  if info.name is not None:
+    s += '%s %s, ' % (typeof(info.type), info.name)
+  s += 'qd=%d an=%d ns=%d ar=%d' % (info.questionCount, info.answerCount,
+                                    info.authorityCount, info.additionalCount)
+  if len(s) > MAX_TABLE_LENGTH:
+    s = s[:MAX_TABLE_LENGTH]
+  return s + '...'
+
 def typeof(t):
     for n, v in _types:
       if n == t:
         return v 
     return 'NONE'
 
-def packetf(qu_data):
-  return str(qu_data[0]).replace("'", '"').replace('b"', '"')[1:] + ','
\ No newline at end of file
+def packetf(data, c) -> str:
+  qu_data = data[0]
+  return JSON_PACKET % (c, _encode(data[1]), _encode(qu_data[HEADER]), _encode(qu_data[BODY]))
\ No newline at end of file
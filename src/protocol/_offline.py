@@ -0,0 +1,134 @@
+import mdns
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# capture files are split into chunks of about this size (in bytes)
+CHUNK_SIZE = 32 << 20
+
+# error bounds of the name frequency sketches (see mdns.CountMinSketch)
+SKETCH_EPS   = 0.001
+SKETCH_DELTA = 0.01
+
+TYPE_PTR = 12
+
+# DNS-SD service type enumeration name (without the domain)
+SERVICES_LABELS = ('_services', '_dns-sd', '_udp')
+
+# Aggregates of a set of captured mDNS messages. Summaries of different
+# chunks/files are combined with merge(), so the order in which chunks are
+# analyzed does not matter. Query names and PTR service types are counted
+# in fixed-size sketches, as randomized instance names would make exact
+# counters grow without bound.
+class CaptureSummary:
+  def __init__(self, eps=SKETCH_EPS, delta=SKETCH_DELTA) -> None:
+    self.packets = 0
+    self.errors = 0
+    self.first = None
+    self.last = None
+    self.sources = Counter()
+    self.qtypes = Counter()
+    self.rrtypes = Counter()
+    self.qnames = mdns.CountMinSketch(eps, delta)
+    self.services = mdns.CountMinSketch(eps, delta)
+    self.ttls = Counter()
+
+  def __str__(self) -> str:
+    return '<CaptureSummary packets=%d errors=%d sources=%d |>' % (
+      self.packets, self.errors, len(self.sources)
+    )
+
+  def add(self, timestamp, source, data):
+    self.packets += 1
+    self.sources[source] += 1
+    if timestamp:
+      self.first = timestamp if self.first is None else min(self.first, timestamp)
+      self.last = timestamp if self.last is None else max(self.last, timestamp)
+
+    try:
+      message = mdns.loadm(data)
+      for q in message.questions:
+        self.qtypes[q.qtype] += 1
+        if type(q.qname) == mdns.DomainName:
+          self.qnames.add(str(q.qname))
+        if q.qtype == TYPE_PTR:
+          self._service(q.qname)
+
+      for section in (message.answers, message.authorities, message.additionalRR):
+        for record in section:
+          self.rrtypes[record.type] += 1
+          self.ttls[record.ttl] += 1
+          if record.type == TYPE_PTR:
+            # one service per record: enumeration records name the service
+            # in their rdata, all others in their owner name
+            if is_enumeration(record.name) and isinstance(record.rdata, mdns.std_rr.RDataPTR):
+              self._service(record.rdata.name)
+            else:
+              self._service(record.name)
+    except Exception:
+      self.errors += 1
+
+  def _service(self, name):
+    if type(name) == mdns.DomainName:
+      s = service_type(name.raw_name)
+      if s:
+        self.services.add(s)
+
+  def merge(self, other):
+    self.packets += other.packets
+    self.errors += other.errors
+    for x in (other.first, other.last):
+      if x is not None:
+        self.first = x if self.first is None else min(self.first, x)
+        self.last = x if self.last is None else max(self.last, x)
+    self.sources.update(other.sources)
+    self.qtypes.update(other.qtypes)
+    self.rrtypes.update(other.rrtypes)
+    self.qnames.merge(other.qnames)
+    self.services.merge(other.services)
+    self.ttls.update(other.ttls)
+    return self
+
+# Returns the DNS-SD service type of a name ('_http._tcp.local' for
+# 'Printer._http._tcp.local') or None. The enumeration meta-query name
+# (_services._dns-sd._udp) is no service.
+def service_type(raw_name) -> str:
+  if tuple(raw_name[:3]) == SERVICES_LABELS:
+    return None
+  for i in range(1, len(raw_name)):
+    if raw_name[i] in ('_tcp', '_udp') and raw_name[i-1].startswith('_'):
+      return '.'.join(raw_name[i-1:])
+  return None
+
+def is_enumeration(name) -> bool:
+  return type(name) == mdns.DomainName and tuple(name.raw_name[:3]) == SERVICES_LABELS
+
+# Worker function: analyzes a single chunk of a capture file (see
+# mdns.PcapReader.split). Runs in a separate process.
+def analyze_chunk(path, chunk, port=mdns.MDNS_PORT, eps=SKETCH_EPS, delta=SKETCH_DELTA) -> CaptureSummary:
+  summary = CaptureSummary(eps, delta)
+  with mdns.PcapReader(path, port) as reader:
+    for timestamp, source, data in reader.read_chunk(chunk):
+      summary.add(timestamp, source, data)
+  return summary
+
+# Splits the given capture files into chunks, analyzes them on a pool of
+# jobs processes (None: one per CPU) and merges the results.
+def analyze(paths, jobs=None, chunk_size=CHUNK_SIZE, port=mdns.MDNS_PORT,
+            eps=SKETCH_EPS, delta=SKETCH_DELTA) -> CaptureSummary:
+  tasks = []
+  for path in paths:
+    with mdns.PcapReader(path, port) as reader:
+      tasks.extend((path, chunk) for chunk in reader.split(chunk_size))
+
+  summary = CaptureSummary(eps, delta)
+  if jobs == 1 or len(tasks) <= 1:
+    for path, chunk in tasks:
+      summary.merge(analyze_chunk(path, chunk, port, eps, delta))
+    return summary
+
+  with ProcessPoolExecutor(max_workers=jobs) as pool:
+    futures = [pool.submit(analyze_chunk, path, chunk, port, eps, delta) for path, chunk in tasks]
+    for future in as_completed(futures):
+      summary.merge(future.result())
+  return summary
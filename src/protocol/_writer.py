@@ -0,0 +1,272 @@
+import gzip
+import lzma
+import os
+import queue
+import shutil
+import threading
+import time
+
+from protocol._analyzing import (
+  FORMATTERS,
+  FLUSH_INTERVAL,
+  FT_ADDR,
+  FT_TABLE,
+  SEP,
+  WRITE_BUFFER,
+  WT_ADDR,
+  WT_TABLE
+)
+
+# compression of closed segments: name -> (file suffix, open function)
+COMPRESSORS = {
+  'gzip': ('.gz', gzip.open),
+  'lzma': ('.xz', lzma.open)
+}
+
+# marks the end of work for the writer threads
+_STOP = object()
+
+def get_formatter(f):
+  for _F in FORMATTERS:
+    if _F.extension == f:
+      return _F
+  raise ValueError("Invalid format - expected one of {}".format([x.extension for x in FORMATTERS]))
+
+# One output of a capture (e.g. the packet table) split into segments. A new
+# segment is started once the current one reached max_size bytes or is
+# older than max_age seconds. Without limits there is a single file named
+# like the ones written by mDNSFormatter.openf().
+class SegmentedFile:
+  def __init__(self, path, name, formatter, max_size=None, max_age=None, on_close=None) -> None:
+    self.path = path
+    self.name = name
+    self.formatter = formatter
+    self.max_size = max_size
+    self.max_age = max_age
+    self.on_close = on_close
+    self.segment = -1
+    self.file = None
+    self.size = 0
+    self._open()
+
+  def _filename(self, segment) -> str:
+    if not (self.max_size or self.max_age):
+      return SEP.join([self.path, '.'.join([self.name, self.formatter.extension])])
+    return SEP.join([self.path, '%s-%04d.%s' % (self.name, segment, self.formatter.extension)])
+
+  def _open(self):
+    _F = self.formatter
+    filename = self._filename(self.segment + 1)
+    self.file = open(filename, 'w', buffering=WRITE_BUFFER)
+    self.segment += 1
+    self.filename = filename
+    self.file.write(_F.iniwriteT() if self.name == FT_TABLE else _F.iniwriteA() if self.name == FT_ADDR else _F.iniwriteP())
+    self.size = 0
+    self.opened = self.flushed = time.monotonic()
+
+  def write(self, s):
+    if self.file is None:
+      self._open()
+    self.file.write(s)
+    self.size += len(s)
+
+  def due(self, now) -> bool:
+    return self.full() or (self.max_age is not None and now - self.opened >= self.max_age)
+
+  def full(self) -> bool:
+    return self.max_size is not None and self.size >= self.max_size
+
+  # the next segment is opened by the next write
+  def rotate(self):
+    self.close()
+
+  def flush(self, now):
+    if self.file is not None and now - self.flushed >= FLUSH_INTERVAL:
+      self.file.flush()
+      self.flushed = now
+
+  # the segment counts as closed even if writing its end fails
+  def close(self):
+    if self.file is None:
+      return
+    f, self.file = self.file, None
+    try:
+      f.write(self.formatter.close())
+    finally:
+      f.close()
+    if self.on_close is not None:
+      self.on_close(self.filename)
+
+# Writes the formatted output of a capture on a dedicated thread. The
+# receive loop only puts (name, writetype, data, no.) items on a queue; the
+# writer formats them in batches, rotates the segments and hands closed
+# segments to a second thread which compresses them.
+#
+# Write errors (e.g. a full disk) are counted in errors and the records
+# that could not be written in dropped; the writer keeps draining the
+# queue, so the receive loop is never stalled by the output.
+class LiveWriter:
+  def __init__(self, path, format, max_size=None, max_age=None, compress=None,
+               maxsize=65536, batch=1024) -> None:
+    if compress is not None and compress not in COMPRESSORS:
+      raise ValueError("Invalid compression - expected one of {}".format(tuple(COMPRESSORS)))
+
+    self.path = path
+    self.formatter = get_formatter(format)
+    self.max_size = max_size
+    self.max_age = max_age
+    self.compress = compress
+    self.batch = batch
+    self.queue = queue.Queue(maxsize)
+    self.outputs = {}
+
+    # updated by the submitting thread
+    self.submitted = 0
+    self.blocked = 0
+    # updated by the writer threads
+    self.written = 0
+    self.compressed = 0
+    self.errors = 0
+    self.dropped = 0
+
+    self._compress_queue = queue.Queue()
+    self._compressor = None
+    if compress is not None:
+      self._compressor = threading.Thread(target=self._compress, name='mdns-compress', daemon=True)
+      self._compressor.start()
+
+    self._thread = threading.Thread(target=self._run, name='mdns-writer', daemon=True)
+    self._thread.start()
+
+  def __str__(self) -> str:
+    return ('<LiveWriter format=%s queued=%d submitted=%d written=%d blocked=%d '
+            'segments=%d compressed=%d errors=%d dropped=%d |>') % (
+      self.formatter.extension, self.queue.qsize(), self.submitted, self.written,
+      self.blocked, self.segments, self.compressed, self.errors, self.dropped
+    )
+
+  # number of segments written so far
+  @property
+  def segments(self) -> int:
+    return sum(out.segment + 1 for out in list(self.outputs.values()))
+
+  # name: output file (FT_TABLE, FT_PACKET or FT_ADDR), c: packet number
+  def submit(self, name, writetype, data, c=0):
+    self.submitted += 1
+    item = (name, writetype, data, c)
+    try:
+      self.queue.put_nowait(item)
+    except queue.Full:
+      self.blocked += 1
+      if not self._put(item):
+        self.dropped += 1
+
+  # Blocks while the queue is full, unless the writer thread is gone.
+  def _put(self, item) -> bool:
+    while self._thread.is_alive():
+      try:
+        self.queue.put(item, timeout=FLUSH_INTERVAL)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  # Writes everything that was submitted, closes the files and waits until
+  # all segments are compressed.
+  def close(self):
+    if self._put(_STOP):
+      self._thread.join()
+    if self._compressor is not None:
+      self._compress_queue.put(_STOP)
+      self._compressor.join()
+
+  def _output(self, name) -> SegmentedFile:
+    out = self.outputs.get(name)
+    if out is None:
+      # the address list is written once, it is never rotated
+      limits = (None, None) if name == FT_ADDR else (self.max_size, self.max_age)
+      out = SegmentedFile(self.path, name, self.formatter, *limits, on_close=self._closed)
+      self.outputs[name] = out
+    return out
+
+  def _closed(self, filename):
+    if self.compress is not None:
+      self._compress_queue.put(filename)
+
+  def _format(self, writetype, data, c) -> str:
+    _F = self.formatter
+    if writetype == WT_TABLE:
+      return _F.writeT(data, c)
+    if writetype == WT_ADDR:
+      return _F.writeA(data)
+    return _F.writeP(data, c)
+
+  def _run(self):
+    stop = False
+    while not stop:
+      try:
+        items = [self.queue.get(timeout=FLUSH_INTERVAL)]
+      except queue.Empty:
+        items = []
+      while items and len(items) < self.batch:
+        try:
+          items.append(self.queue.get_nowait())
+        except queue.Empty:
+          break
+
+      # name -> formatted records of this batch
+      chunks = {}
+      for item in items:
+        if item is _STOP:
+          stop = True
+          continue
+        name, writetype, data, c = item
+        try:
+          chunks.setdefault(name, []).append(self._format(writetype, data, c))
+        except Exception:
+          self.errors += 1
+
+      now = time.monotonic()
+      for name, parts in chunks.items():
+        for i, part in enumerate(parts):
+          try:
+            out = self._output(name)
+            out.write(part)
+            # the size limit is checked per record, so a segment exceeds
+            # it by at most one record
+            if out.full():
+              out.rotate()
+          except OSError:
+            self.errors += 1
+            self.dropped += len(parts) - i
+            break
+          self.written += 1
+
+      for out in self.outputs.values():
+        try:
+          if out.file is not None and out.size and out.due(now):
+            out.rotate()
+          else:
+            out.flush(now)
+        except OSError:
+          self.errors += 1
+
+    for out in self.outputs.values():
+      try:
+        out.close()
+      except OSError:
+        self.errors += 1
+
+  def _compress(self):
+    suffix, _open = COMPRESSORS[self.compress]
+    while True:
+      filename = self._compress_queue.get()
+      if filename is _STOP:
+        break
+      try:
+        with open(filename, 'rb') as src, _open(filename + suffix, 'wb') as dst:
+          shutil.copyfileobj(src, dst, WRITE_BUFFER)
+        os.remove(filename)
+        self.compressed += 1
+      except OSError:
+        self.errors += 1
@@ -407,11 +407,24 @@ class MulticastDNSListener:
     def bsend(self, msg) -> int:
         self.sock.sendto(msg, self._address)
 
-    def foreach(self):
+    def foreach(self, prefilter=None, ring=None):
+        # prefilter: optional callable on the raw datagram, packets it
+        # rejects are dropped before anyone parses them
+        # ring: optional receive ring (mdns.RecvRing) - all ready datagrams
+        # are drained per wakeup into preallocated buffers and yielded as
+        # memoryviews, which are only valid until the next receive() - copy
+        # them with bytes() to keep them longer
         try:
             while not self.stopped:
-                data, address = self.sock.recvfrom(2048)
-                yield (data, address)
+                if ring is None:
+                    batch = (self.sock.recvfrom(2048),)
+                else:
+                    batch = ring.receive(self.sock)
+
+                for data, address in batch:
+                    if prefilter is not None and not prefilter(data):
+                        continue
+                    yield (data, address)
         except KeyboardInterrupt or ParsingException or socket.timeout:
             pass
         except Exception:
@@ -0,0 +1,43 @@
+import struct
+import unittest
+
+import mdns
+
+def _name(labels) -> bytes:
+  return b''.join(bytes([len(x)]) + x.encode() for x in labels) + b'\x00'
+
+def _rr(labels, rrtype, ttl, rdata) -> bytes:
+  return _name(labels) + struct.pack('!HHIH', rrtype, 1, ttl, len(rdata)) + rdata
+
+def _response(*records) -> bytes:
+  return struct.pack('!HHHHHH', 0, 0x8400, 0, len(records), 0, 0) + b''.join(records)
+
+HOST = ['host', 'local']
+
+class KnownAnswerTest(unittest.TestCase):
+  def setUp(self):
+    # type 52 (TLSA) has no decoder, its rdata stays None
+    self.cache = mdns.RecordCache()
+    self.cache.update(mdns.loadm(_response(
+      _rr(HOST, 52, 120, b'\x01\x02'),
+      _rr(HOST, 1, 120, bytes([10, 0, 0, 1]))
+    )), now=0)
+
+  def test_any_query_skips_unknown_types(self):
+    q = mdns.buildq('host.local', 255)
+    message = mdns.buildm(questions=[q], cache=self.cache, now=0)
+    self.assertEqual([x.type for x in message.answers], [1])
+
+    buf = bytearray()
+    mdns.to_bytes(message, buf)
+    decoded = mdns.loadm(bytes(buf))
+    self.assertEqual(decoded.h.answerCount, 1)
+    self.assertEqual(decoded.answers[0].rdata.addr, '10.0.0.1')
+
+  def test_half_ttl(self):
+    q = mdns.buildq('host.local', 1)
+    self.assertEqual(len(self.cache.known_answers([q], now=59)), 1)
+    self.assertEqual(len(self.cache.known_answers([q], now=61)), 0)
+
+if __name__ == '__main__':
+  unittest.main()